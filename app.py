@@ -12,18 +12,21 @@ st.set_page_config(
 )
 
 # Import modules
-from core.auth import AuthManager
-from core.database import DatabaseManager
+from core.auth import get_auth_manager
+from core.database import get_database_manager
 from core.ui import UIManager
 from core.config import Config
+from utils import extract, semantic
+from utils.pager import get_pager, ensure_first_page, load_next_page, reset_pager
+from utils.styles import reflected_theme
 
 # Initialize managers
 @st.cache_resource
 def init_managers():
     """Initialize all system managers"""
     config = Config()
-    auth_manager = AuthManager(config)
-    db_manager = DatabaseManager(config)
+    auth_manager = get_auth_manager()
+    db_manager = get_database_manager()
     ui_manager = UIManager()
     return auth_manager, db_manager, ui_manager
 
@@ -36,13 +39,13 @@ if 'user_data' not in st.session_state:
     st.session_state.user_data = None
 if 'current_page' not in st.session_state:
     st.session_state.current_page = 'home'
-if 'theme' not in st.session_state:
-    st.session_state.theme = 'light'
+# Theme is switched in the browser; its choice reaches the server lazily via ?theme=
+st.session_state.theme = reflected_theme(st.session_state.get('theme', 'light'))
 
-# Apply theme
+# Apply theme (only sent when it changes; the browser's stored choice wins)
 ui_manager.apply_theme(st.session_state.theme)
 
-# Load CSS (after theme applied for correct variables)
+# Load CSS once per session (theme switches through CSS variables, not a new stylesheet)
 ui_manager.load_css()
 
 # Main application logic
@@ -71,11 +74,7 @@ def show_login_page():
     with st.container():
         col_t1, col_t2, col_t3 = st.columns([1,1,1])
         with col_t3:
-            selected = ui_manager.render_theme_toggle(st.session_state.theme)
-            if selected != st.session_state.theme:
-                st.session_state.theme = selected
-                ui_manager.apply_theme(selected)
-                st.rerun()
+            ui_manager.render_theme_toggle(st.session_state.theme)
     
     # Login/Register tabs
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -185,11 +184,7 @@ def show_main_app():
     # Sidebar navigation
     with st.sidebar:
         # Theme toggle on sidebar
-        selected = ui_manager.render_theme_toggle(st.session_state.theme)
-        if selected != st.session_state.theme:
-            st.session_state.theme = selected
-            ui_manager.apply_theme(selected)
-            st.rerun()
+        ui_manager.render_theme_toggle(st.session_state.theme)
 
         ui_manager.render_user_info(user_email)
         
@@ -248,6 +243,12 @@ def show_home_page():
     with col4:
         ui_manager.render_stat_card("💾", "Dung lượng", f"{stats['total_size']:.1f} MB", "#dc3545")
     
+    # Tag cloud (reads only the normalized tags table)
+    tag_cloud = db_manager.get_tag_cloud(user_id, limit=30)
+    if tag_cloud:
+        st.markdown("### 🏷️ Tags phổ biến")
+        ui_manager.render_tag_cloud(tag_cloud)
+    
     # Quick actions
     st.markdown("### 🚀 Hành động nhanh")
     col1, col2, col3 = st.columns(3)
@@ -284,42 +285,84 @@ def show_documents_page():
     
     with col1:
         search_term = st.text_input("🔍 Tìm kiếm", placeholder="Nhập tên tài liệu...")
+        # Only offer search modes that have data on this server
+        search_modes = ["Tên, tags, môn học", "Nội dung file", "Ngữ nghĩa (AI)"]
+        if not extract.extraction_enabled():
+            search_modes.remove("Nội dung file")
+            st.caption("ℹ️ Tìm trong nội dung file chưa khả dụng: máy chủ chưa bật trích xuất nội dung.")
+        if not semantic.semantic_search_enabled():
+            search_modes.remove("Ngữ nghĩa (AI)")
+            st.caption("ℹ️ Tìm kiếm ngữ nghĩa chưa khả dụng: máy chủ chưa bật tạo embedding.")
+        search_mode = st.radio("Tìm trong", search_modes, horizontal=True,
+                               label_visibility="collapsed", key="documents_search_mode")
     
     with col2:
         subjects = db_manager.get_user_subjects(user_id)
-        subject_options = ["Tất cả"] + [s['name'] for s in subjects]
-        selected_subject = st.selectbox("📚 Môn học", subject_options)
-    
+        subject_ids = {s['name']: s['id'] for s in subjects}
+        selected_subject = st.selectbox("📚 Môn học", ["Tất cả"] + list(subject_ids))
+        subject_id = subject_ids.get(selected_subject)
+    
+    # Browsing pages on the server in the chosen order (keyset on created_at or file_name);
+    # search results are paged by relevance, so they offer no other order
+    browse_sorts = {
+        "Mới nhất": ("created_at", False),
+        "Cũ nhất": ("created_at", True),
+        "Tên A-Z": ("file_name", True),
+        "Tên Z-A": ("file_name", False),
+    }
     with col3:
-        sort_options = ["Mới nhất", "Cũ nhất", "Tên A-Z", "Tên Z-A"]
+        sort_options = ["Liên quan nhất"] if search_term.strip() else list(browse_sorts)
         sort_by = st.selectbox("🔄 Sắp xếp", sort_options)
     
-    # Get and filter documents
-    documents = db_manager.get_user_documents(user_id)
-    
-    # Apply filters
+    # Get documents page-by-page, with the subject filter applied on the server:
+    # ranked full-text search when a term is given, otherwise a keyset cursor
+    search_term = search_term.strip()
     if search_term:
-        documents = [d for d in documents if search_term.lower() in d['file_name'].lower()]
-    
-    if selected_subject != "Tất cả":
-        documents = [d for d in documents if d.get('subject_name') == selected_subject]
+        pager = get_pager("documents_pager", (user_id, "search", search_term, search_mode, subject_id))
+        
+        def fetch_page(cursor):
+            if search_mode == "Ngữ nghĩa (AI)":
+                # One page of nearest chunks; the subject filter applies to that page
+                page = db_manager.semantic_search(user_id, search_term)
+                if subject_id is not None:
+                    page["data"] = [d for d in page["data"] if d.get("subject_id") == subject_id]
+                return page
+            if search_mode == "Nội dung file":
+                return db_manager.search_document_contents(user_id, search_term, cursor=cursor, subject_id=subject_id)
+            return db_manager.search_documents(user_id, search_term, cursor=cursor, subject_id=subject_id)
+    else:
+        order_by, ascending = browse_sorts[sort_by]
+        pager = get_pager("documents_pager", (user_id, order_by, ascending, subject_id))
+        
+        def fetch_page(cursor):
+            return db_manager.get_documents_page(
+                user_id, cursor=cursor, ascending=ascending, subject_id=subject_id, order_by=order_by
+            )
     
-    # Apply sorting
-    if sort_by == "Mới nhất":
-        documents.sort(key=lambda x: x['created_at'], reverse=True)
-    elif sort_by == "Cũ nhất":
-        documents.sort(key=lambda x: x['created_at'])
-    elif sort_by == "Tên A-Z":
-        documents.sort(key=lambda x: x['file_name'])
-    elif sort_by == "Tên Z-A":
-        documents.sort(key=lambda x: x['file_name'], reverse=True)
+    try:
+        ensure_first_page(pager, fetch_page)
+    except Exception as e:
+        # Embedding API / search RPC errors are reported, not raised through the page
+        st.error(f"❌ Không tìm kiếm được: {e}")
+    documents = list(pager["items"])
     
     # Display results
     if documents:
         st.info(f"📊 Hiển thị {len(documents)} tài liệu")
-        ui_manager.render_document_grid(documents, db_manager)
+        ui_manager.render_document_grid(
+            documents,
+            db_manager,
+            scope=pager["scope"],
+            has_more=lambda: pager["has_more"],
+            load_more=lambda: load_next_page(pager, fetch_page),
+        )
     else:
         ui_manager.render_empty_state("📄", "Không tìm thấy tài liệu", "Thử thay đổi bộ lọc hoặc upload tài liệu mới")
+    
+    if not documents and pager["has_more"]:
+        if st.button("⬇️ Tải thêm", key="documents_load_more", use_container_width=True):
+            load_next_page(pager, fetch_page)
+            st.rerun()
 
 def show_upload_page():
     """Display upload page"""
@@ -329,13 +372,14 @@ def show_upload_page():
     
     with st.form("upload_form"):
         # File upload
-        uploaded_file = st.file_uploader(
+        uploaded_files = st.file_uploader(
             "Chọn tài liệu",
             type=['pdf', 'docx', 'txt', 'xlsx', 'pptx', 'doc'],
-            help="Hỗ trợ: PDF, DOCX, TXT, XLSX, PPTX (tối đa 200MB)"
+            accept_multiple_files=True,
+            help="Hỗ trợ: PDF, DOCX, TXT, XLSX, PPTX (tối đa 200MB mỗi file)"
         )
         
-        if uploaded_file:
+        for uploaded_file in uploaded_files or []:
             ui_manager.render_file_preview(uploaded_file)
         
         # Metadata
@@ -357,23 +401,35 @@ def show_upload_page():
         submit_btn = st.form_submit_button("🚀 Upload", use_container_width=True, type="primary")
         
         if submit_btn:
-            if uploaded_file:
-                with st.spinner("Đang upload..."):
-                    result = db_manager.upload_document(
-                        user_id=user_id,
-                        file=uploaded_file,
-                        subject_name=selected_subject if selected_subject else None,
-                        tags=tags_input
-                    )
-                    
-                    if result['success']:
-                        st.success("🎉 Upload thành công!")
-                        st.balloons()
-                        # Auto redirect to documents
-                        st.session_state.current_page = "documents"
-                        st.rerun()
-                    else:
-                        st.error(f"❌ {result['message']}")
+            if uploaded_files:
+                # One progress bar per file, fed by bytes actually sent
+                bars = [st.progress(0, text=f"📄 {f.name}") for f in uploaded_files]
+                
+                def show_progress(progress):
+                    for index, (sent, total) in progress.items():
+                        bars[index].progress(min(sent / total, 1.0) if total else 1.0, text=f"📄 {uploaded_files[index].name}")
+                
+                result = db_manager.upload_documents(
+                    user_id=user_id,
+                    files=uploaded_files,
+                    subject_name=selected_subject if selected_subject else None,
+                    tags=tags_input,
+                    on_progress=show_progress
+                )
+                
+                for name, message in result.get('failed', []):
+                    st.error(f"❌ {name}: {message}")
+                if result.get('message'):
+                    st.error(f"❌ {result['message']}")
+                
+                if result.get('uploaded'):
+                    reset_pager("documents_pager")
+                if result['success']:
+                    st.success(f"🎉 Upload thành công {result['uploaded']} tài liệu!")
+                    st.balloons()
+                    # Auto redirect to documents
+                    st.session_state.current_page = "documents"
+                    st.rerun()
             else:
                 st.warning("⚠️ Vui lòng chọn file để upload")
 
@@ -409,9 +465,12 @@ def show_subjects_page():
     subjects = db_manager.get_user_subjects(user_id)
     
     if subjects:
+        # One grouped query for every subject's document count and size
+        subject_counts = db_manager.get_subject_document_counts(user_id)
         st.markdown("### Danh sách môn học")
         for s in subjects:
             sid = s.get("id")
+            counts = subject_counts.get(sid, {})
             cols = st.columns([4, 1, 1])
             with cols[0]:
                 new_name = st.text_input(
@@ -419,6 +478,10 @@ def show_subjects_page():
                     value=s.get("name", ""),
                     key=f"sub_name_{sid}"
                 )
+                st.caption(
+                    f"📄 {counts.get('document_count', 0)} tài liệu · "
+                    f"💾 {counts.get('total_size_bytes', 0) / (1024 * 1024):.1f} MB"
+                )
             with cols[1]:
                 if st.button("💾 Lưu", key=f"save_sub_{sid}", use_container_width=True):
                     if new_name.strip():
@@ -1,45 +1,260 @@
 from __future__ import annotations
-from typing import Dict, Any
-from utils.db import supabase
+from typing import Dict, Any, List, Tuple
+import heapq
+import itertools
+import random
+import threading
+import time
+import weakref
+import streamlit as st
+from core.config import Config
+from utils import db as db_utils
+
+try:
+    import jwt
+except ImportError:  # PyJWT is optional; without it we ask the auth server
+    jwt = None
+
+# session_state key holding the locally verified user for the current access token
+USER_CACHE_KEY = "auth_user_cache"
+# Seconds of clock skew tolerated when checking token expiry
+JWT_LEEWAY = 30
+# Asymmetric algorithms accepted for keys from the project's JWKS
+JWKS_ALGORITHMS = ("RS256", "ES256")
+# Consecutive failed background refreshes before a session is dropped from the schedule
+MAX_REFRESH_FAILURES = 8
+
+@st.cache_resource
+def _jwks_client(jwks_url: str):
+    """Process-wide JWKS client; signing keys are fetched once and cached."""
+    return jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=3600)
+
+class _RefreshEntry:
+    """Scheduling state for one session's client."""
+    def __init__(self, client) -> None:
+        self.client_ref = weakref.ref(client)
+        # Single-flight: only one refresh per session at a time
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.failures = 0
+        # When the background refresh is scheduled to run (time.time() scale)
+        self.due_at = 0.0
+
+class TokenRefresher:
+    """Background scheduler that renews session tokens ahead of expiry.
+
+    One daemon thread serves every session. Each client is refreshed
+    margin + jitter seconds before its access token expires; clients are
+    held weakly, so a session that ends simply drops out of the schedule.
+    """
+    def __init__(self, margin_seconds: float = 300.0, jitter_seconds: float = 60.0) -> None:
+        self.margin_seconds = margin_seconds
+        self.jitter_seconds = jitter_seconds
+        self._heap: List[Tuple[float, int, _RefreshEntry]] = []
+        self._entries: Dict[int, _RefreshEntry] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def schedule(self, client) -> None:
+        with self._cond:
+            old = self._entries.pop(id(client), None)
+            if old is not None:
+                old.cancelled = True
+            entry = _RefreshEntry(client)
+            self._entries[id(client)] = entry
+            self._push(entry, self._due_time(client))
+
+    def unschedule(self, client) -> None:
+        with self._cond:
+            entry = self._entries.pop(id(client), None)
+            if entry is not None:
+                entry.cancelled = True
+
+    def _due_time(self, client) -> float:
+        session = client.auth.get_session()
+        expires_at = getattr(session, "expires_at", None) if session else None
+        if not expires_at:
+            return time.time() + self.margin_seconds
+        return expires_at - self.margin_seconds - random.uniform(0, self.jitter_seconds)
+
+    def _push(self, entry: _RefreshEntry, due: float) -> None:
+        entry.due_at = due
+        heapq.heappush(self._heap, (due, next(self._seq), entry))
+        self._cond.notify()
+
+    def _refresh(self, entry: _RefreshEntry) -> None:
+        client = entry.client_ref()
+        if client is None:
+            return
+        with entry.lock:
+            # Another caller may have refreshed while we waited for the lock: the new token
+            # would not be due (even with the largest jitter) until after this entry's slot
+            session = client.auth.get_session()
+            expires_at = getattr(session, "expires_at", None) if session else None
+            if expires_at and expires_at - self.margin_seconds - self.jitter_seconds > entry.due_at:
+                return
+            client.auth.refresh_session()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = (self._heap[0][0] - time.time()) if self._heap else None
+                    self._cond.wait(timeout)
+                _, _, entry = heapq.heappop(self._heap)
+            if entry.cancelled:
+                continue
+            client = entry.client_ref()
+            if client is None:
+                with self._cond:
+                    self._entries = {k: v for k, v in self._entries.items() if v is not entry}
+                continue
+            try:
+                self._refresh(entry)
+                entry.failures = 0
+                due = self._due_time(client)
+            except Exception:
+                # Back off (jittered) and try again; give up on sessions that keep failing
+                entry.failures += 1
+                if entry.failures > MAX_REFRESH_FAILURES:
+                    self.unschedule(client)
+                    continue
+                due = time.time() + min(2 ** entry.failures, 60) + random.uniform(0, 1)
+            with self._cond:
+                if not entry.cancelled:
+                    self._push(entry, due)
+
+@st.cache_resource
+def get_token_refresher(margin_seconds: float, jitter_seconds: float) -> TokenRefresher:
+    """Process-wide refresher shared by every session."""
+    return TokenRefresher(margin_seconds, jitter_seconds)
 
 class AuthManager:
-    """Authentication manager using Supabase."""
+    """Authentication manager using Supabase.
+
+    Each Streamlit session signs in on its own client (bound into session_state),
+    so concurrent users never share auth state; all clients share one HTTP pool.
+    """
     def __init__(self, config) -> None:
         self.config = config
 
     def login(self, email: str, password: str) -> Dict[str, Any]:
         try:
-            supabase.auth.sign_in_with_password({"email": email, "password": password})
-            user = supabase.auth.get_user()
+            client = db_utils.create_session_client()
+            auth_res = client.auth.sign_in_with_password({"email": email, "password": password})
+            # The sign-in response already carries the user; no extra get_user() round trip
+            user = getattr(auth_res, "user", None)
             user_data = {
-                "id": user.user.id if getattr(user, "user", None) else None,
-                "email": user.user.email if getattr(user, "user", None) else email,
+                "id": user.id if user else None,
+                "email": user.email if user else email,
             }
             if not user_data["id"]:
                 return {"success": False, "message": "Không lấy được thông tin người dùng", "user": None}
+            db_utils.bind_session_client(client)
+            self._token_refresher().schedule(client)
+            # Standalone pages read the session from here
+            st.session_state.user_session = auth_res
+            session = getattr(auth_res, "session", None)
+            if session is not None:
+                self._cache_user(session.access_token, user_data, getattr(session, "expires_at", None))
             return {"success": True, "message": "Đăng nhập thành công", "user": user_data}
         except Exception as e:
             return {"success": False, "message": str(e), "user": None}
 
+    def _token_refresher(self) -> TokenRefresher:
+        return get_token_refresher(
+            self.config.token_refresh_margin_seconds, self.config.token_refresh_jitter_seconds
+        )
+
+    # -------- Local token verification --------
+    def _cache_user(self, token: str, user: Dict[str, Any], expires_at: float | None) -> None:
+        st.session_state[USER_CACHE_KEY] = {"token": token, "user": user, "expires_at": expires_at}
+
+    def _verify_token(self, token: str) -> Dict[str, Any] | None:
+        """Decode and verify the access token locally; None when it cannot be verified here."""
+        if jwt is None:
+            return None
+        options = {"require": ["exp", "sub"]}
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get("alg") == "HS256":
+                if not self.config.supabase_jwt_secret:
+                    return None
+                key = self.config.supabase_jwt_secret
+                algorithms = ["HS256"]
+            elif self.config.jwks_url:
+                # The accepted algorithm comes from the JWKS key, never from the token header
+                signing_key = _jwks_client(self.config.jwks_url).get_signing_key_from_jwt(token)
+                key = signing_key.key
+                key_algorithm = getattr(signing_key, "algorithm_name", None)
+                algorithms = [key_algorithm] if key_algorithm in JWKS_ALGORITHMS else list(JWKS_ALGORITHMS)
+            else:
+                return None
+            return jwt.decode(
+                token,
+                key,
+                algorithms=algorithms,
+                audience="authenticated",
+                leeway=JWT_LEEWAY,
+                options=options,
+            )
+        except Exception:
+            return None
+
     def register(self, email: str, password: str) -> Dict[str, Any]:
         try:
-            supabase.auth.sign_up({"email": email, "password": password})
+            # Throwaway client: signing up must not touch anyone's signed-in state
+            db_utils.create_session_client().auth.sign_up({"email": email, "password": password})
             return {"success": True, "message": "Đăng ký thành công"}
         except Exception as e:
             return {"success": False, "message": str(e)}
 
     def logout(self) -> None:
         try:
-            supabase.auth.sign_out()
+            client = st.session_state.get(db_utils.SESSION_CLIENT_KEY)
+            if client is not None:
+                self._token_refresher().unschedule(client)
+                client.auth.sign_out()
         except Exception:
             # Ignore sign out errors to keep UX smooth
             pass
+        db_utils.bind_session_client(None)
+        st.session_state.user_session = None
+        st.session_state.pop(USER_CACHE_KEY, None)
 
     def current_user(self) -> Dict[str, Any] | None:
         try:
-            user = supabase.auth.get_user()
+            client = st.session_state.get(db_utils.SESSION_CLIENT_KEY)
+            if client is None:
+                return None
+            # get_session() reads the stored session; it only hits the network to refresh
+            session = client.auth.get_session()
+            if session is None:
+                return None
+            token = session.access_token
+            cached = st.session_state.get(USER_CACHE_KEY)
+            if cached and cached["token"] == token and (
+                not cached["expires_at"] or cached["expires_at"] > time.time()
+            ):
+                return cached["user"]
+            claims = self._verify_token(token)
+            if claims:
+                user_data = {"id": claims["sub"], "email": claims.get("email")}
+                self._cache_user(token, user_data, claims.get("exp"))
+                return user_data
+            # Cannot verify locally (no PyJWT / secret / JWKS): ask the auth server once per token
+            user = client.auth.get_user(token)
             if getattr(user, "user", None):
-                return {"id": user.user.id, "email": user.user.email}
+                user_data = {"id": user.user.id, "email": user.user.email}
+                self._cache_user(token, user_data, getattr(session, "expires_at", None))
+                return user_data
         except Exception:
             pass
         return None
+
+@st.cache_resource
+def get_auth_manager() -> AuthManager:
+    """Process-wide AuthManager, so app.py and the standalone pages sign in and out the same way."""
+    return AuthManager(Config())
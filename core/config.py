@@ -6,7 +6,26 @@ class Config:
         # Secrets for Supabase
         self.supabase_url: str = st.secrets.get("SUPABASE_URL", "")
         self.supabase_key: str = st.secrets.get("SUPABASE_KEY", "")
+        # Local JWT verification: HS256 project secret, or the project's JWKS for asymmetric keys
+        self.supabase_jwt_secret: str = st.secrets.get("SUPABASE_JWT_SECRET", "")
+        self.jwks_url: str = self.supabase_url.rstrip("/") + "/auth/v1/.well-known/jwks.json" if self.supabase_url else ""
+        # Background token refresh: renew this many seconds before expiry, plus random jitter
+        self.token_refresh_margin_seconds: float = float(st.secrets.get("TOKEN_REFRESH_MARGIN_SECONDS", 300))
+        self.token_refresh_jitter_seconds: float = float(st.secrets.get("TOKEN_REFRESH_JITTER_SECONDS", 60))
         # Storage bucket name
         self.storage_bucket: str = "document_files"
+        # Pagination
+        self.documents_page_size: int = int(st.secrets.get("DOCUMENTS_PAGE_SIZE", 50))
+        # Per-user read cache in DatabaseManager
+        self.cache_ttl_seconds: float = float(st.secrets.get("CACHE_TTL_SECONDS", 60))
+        self.cache_max_entries: int = int(st.secrets.get("CACHE_MAX_ENTRIES", 512))
+        # Log cache hit/miss statistics every N lookups (0 disables)
+        self.cache_stats_log_interval: int = int(st.secrets.get("CACHE_STATS_LOG_INTERVAL", 1000))
+        # Number of files uploaded concurrently in a multi-file upload
+        self.upload_workers: int = int(st.secrets.get("UPLOAD_WORKERS", 4))
+        # Download links: "lazy" resolves on click, "presign" signs every visible card
+        self.download_mode: str = st.secrets.get("DOWNLOAD_MODE", "lazy")
+        # Files up to this size are streamed through st.download_button instead of a signed link
+        self.inline_download_max_bytes: int = int(st.secrets.get("INLINE_DOWNLOAD_MAX_BYTES", 5 * 1024 * 1024))
         # UI config
         self.css_path: str = "styles/custom.css"
@@ -1,17 +1,147 @@
 from __future__ import annotations
-from typing import Any, Dict, List
-from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+from collections import OrderedDict
 import io
+import logging
+import threading
+import time
+import streamlit as st
 
+from core.config import Config
 from utils import db as db_utils
+from utils import extract, semantic
+
+logger = logging.getLogger(__name__)
+
+# Cached reads that depend on each table; subject renames show up in
+# documents via the embedded subjects(name), so subjects fan out to both.
+_DEPENDENT_SCOPES = {
+    "documents": ("documents",),
+    "subjects": ("subjects", "documents"),
+}
+
+class UserCache:
+    """Per-user read cache with TTL expiry and size-bounded LRU eviction.
+
+    Every (user, scope) has a generation counter bumped by invalidate(); a load that
+    overlaps an invalidation is returned to its caller but not stored, so it cannot
+    put stale rows back for a full TTL.
+    """
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 512, stats_log_interval: int = 1000) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats_log_interval = stats_log_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_loads = 0
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        # (user_id, scope) -> generation; user_id None holds the all-users generation of a scope
+        self._generations: Dict[Tuple[str | None, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _generation(self, user_id: str, scope: str) -> Tuple[int, int]:
+        return self._generations.get((None, scope), 0), self._generations.get((user_id, scope), 0)
+
+    def get_or_load(self, user_id: str, scope: str, key: Tuple, loader: Callable[[], Any]) -> Any:
+        cache_key = (user_id, scope) + key
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                self._maybe_log_stats()
+                return entry[1]
+            self.misses += 1
+            self._maybe_log_stats()
+            generation = self._generation(user_id, scope)
+        value = loader()
+        with self._lock:
+            if self._generation(user_id, scope) != generation:
+                # Invalidated while loading: the value may predate the write
+                self.stale_loads += 1
+                return value
+            # TTL counts from when the data arrived, not from when the load started
+            self._entries[cache_key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, table: str, user_id: str | None = None) -> None:
+        scopes = _DEPENDENT_SCOPES.get(table, (table,))
+        with self._lock:
+            for scope in scopes:
+                gen_key = (user_id, scope)
+                self._generations[gen_key] = self._generations.get(gen_key, 0) + 1
+            for cache_key in list(self._entries):
+                if cache_key[1] in scopes and (user_id is None or cache_key[0] == user_id):
+                    del self._entries[cache_key]
+
+    def _maybe_log_stats(self) -> None:
+        # Called with the lock held
+        lookups = self.hits + self.misses
+        if self.stats_log_interval and lookups % self.stats_log_interval == 0:
+            logger.info(
+                "UserCache: %d lookups, hit rate %.1f%%, %d entries, %d evictions, %d stale loads dropped",
+                lookups, 100.0 * self.hits / lookups, len(self._entries), self.evictions, self.stale_loads,
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_loads": self.stale_loads,
+                "entries": len(self._entries),
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
 
 class DatabaseManager:
     """Data layer abstraction over utils.db"""
     def __init__(self, config) -> None:
         self.config = config
+        self.cache = UserCache(
+            ttl_seconds=getattr(config, "cache_ttl_seconds", 60.0),
+            max_entries=getattr(config, "cache_max_entries", 512),
+            stats_log_interval=getattr(config, "cache_stats_log_interval", 1000),
+        )
+        # Every write through utils.db (including the pages) invalidates the affected user
+        db_utils.register_change_listener(self.cache.invalidate)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
 
     # -------- Aggregations / Stats --------
     def get_user_statistics(self, user_id: str) -> Dict[str, Any]:
+        # Subject changes fan out to the documents scope, so one scope covers both tables
+        return self.cache.get_or_load(
+            user_id, "documents", ("stats",), lambda: self._load_user_statistics(user_id)
+        )
+
+    def _load_user_statistics(self, user_id: str) -> Dict[str, Any]:
+        try:
+            row = db_utils.get_user_statistics(user_id)
+        except Exception:
+            # RPC not deployed (or failed): compute from the raw rows instead
+            row = None
+        if not row:
+            return self._compute_user_statistics(user_id)
+        return {
+            "total_documents": int(row.get("total_documents") or 0),
+            "total_subjects": int(row.get("total_subjects") or 0),
+            "total_tags": int(row.get("total_tags") or 0),
+            "total_size": float(row.get("total_size_bytes") or 0) / (1024 * 1024),
+        }
+
+    def _compute_user_statistics(self, user_id: str) -> Dict[str, Any]:
         documents = db_utils.get_user_documents(user_id)
         subjects = db_utils.get_user_subjects(user_id)
         total_docs = len(documents or [])
@@ -47,24 +177,115 @@ class DatabaseManager:
 
     # -------- Documents --------
     def get_recent_documents(self, user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
-        docs = db_utils.get_user_documents(user_id) or []
-        # Fallback: sort by created_at desc if present
-        try:
-            docs.sort(key=lambda x: x.get("created_at"), reverse=True)
-        except Exception:
-            pass
-        return docs[:limit]
+        # Ordered + limited server-side, only the columns render_document_list shows
+        docs = self.cache.get_or_load(
+            user_id, "documents", ("recent", limit), lambda: db_utils.get_recent_documents(user_id, limit)
+        )
+        return list(docs)
+
+    def get_documents_page(
+        self,
+        user_id: str,
+        cursor: Dict[str, Any] | None = None,
+        page_size: int | None = None,
+        ascending: bool = False,
+        tags: List[str] | None = None,
+        subject_id: int | None = None,
+        order_by: str = "created_at",
+    ) -> Dict[str, Any]:
+        page_size = page_size or self.config.documents_page_size
+        cursor_key = (cursor or {}).get(order_by), (cursor or {}).get("id")
+        filter_key = (tuple(sorted(tags or ())), subject_id)
+        page = self.cache.get_or_load(
+            user_id,
+            "documents",
+            ("page", order_by, cursor_key, page_size, ascending, filter_key),
+            lambda: db_utils.get_user_documents_page(
+                user_id, cursor=cursor, page_size=page_size, ascending=ascending,
+                tags=tags, subject_id=subject_id, order_by=order_by,
+            ),
+        )
+        # Callers sort/filter in place; hand out a copy of the cached list
+        return {"data": list(page["data"]), "next_cursor": page["next_cursor"]}
+
+    def search_documents(
+        self,
+        user_id: str,
+        query: str,
+        cursor: Dict[str, Any] | None = None,
+        page_size: int | None = None,
+        tags: List[str] | None = None,
+        subject_id: int | None = None,
+    ) -> Dict[str, Any]:
+        page_size = page_size or self.config.documents_page_size
+        offset = (cursor or {}).get("offset", 0)
+        filter_key = (tuple(sorted(tags or ())), subject_id)
+        page = self.cache.get_or_load(
+            user_id,
+            "documents",
+            ("search", query, offset, page_size, filter_key),
+            lambda: db_utils.search_documents(
+                user_id, query, cursor=cursor, page_size=page_size, tags=tags, subject_id=subject_id
+            ),
+        )
+        return {"data": list(page["data"]), "next_cursor": page["next_cursor"]}
+
+    def search_document_contents(
+        self,
+        user_id: str,
+        query: str,
+        cursor: Dict[str, Any] | None = None,
+        page_size: int | None = None,
+        tags: List[str] | None = None,
+        subject_id: int | None = None,
+    ) -> Dict[str, Any]:
+        page_size = page_size or self.config.documents_page_size
+        offset = (cursor or {}).get("offset", 0)
+        filter_key = (tuple(sorted(tags or ())), subject_id)
+        page = self.cache.get_or_load(
+            user_id,
+            "documents",
+            ("content_search", query, offset, page_size, filter_key),
+            lambda: db_utils.search_document_contents(
+                user_id, query, cursor=cursor, page_size=page_size, tags=tags, subject_id=subject_id
+            ),
+        )
+        return {"data": list(page["data"]), "next_cursor": page["next_cursor"]}
+
+    def semantic_search(self, user_id: str, query: str, limit: int = 20) -> Dict[str, Any]:
+        page = self.cache.get_or_load(
+            user_id, "documents", ("semantic", query, limit), lambda: semantic.semantic_search(user_id, query, limit)
+        )
+        return {"data": list(page["data"]), "next_cursor": None}
 
-    def get_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
-        return db_utils.get_user_documents(user_id) or []
+    def count_user_documents(self, user_id: str) -> int:
+        return self.cache.get_or_load(
+            user_id, "documents", ("count",), lambda: db_utils.count_user_documents(user_id)
+        )
+
+    def get_subject_document_counts(self, user_id: str) -> Dict[Any, Dict[str, int]]:
+        return self.cache.get_or_load(
+            user_id, "documents", ("subject_counts",), lambda: db_utils.get_subject_document_counts(user_id)
+        )
+
+    # -------- Tags --------
+    def get_tag_cloud(self, user_id: str, limit: int | None = None) -> List[Dict[str, Any]]:
+        # Tag counts follow documents writes (maintained by triggers), so they share its scope
+        return self.cache.get_or_load(
+            user_id, "documents", ("tag_cloud", limit), lambda: db_utils.get_tag_cloud(user_id, limit=limit)
+        )
 
     # -------- Subjects --------
     def get_user_subjects(self, user_id: str) -> List[Dict[str, Any]]:
-        return db_utils.get_user_subjects(user_id) or []
+        subjects = self.cache.get_or_load(
+            user_id, "subjects", ("all",), lambda: db_utils.get_user_subjects(user_id) or []
+        )
+        return list(subjects)
 
     def add_subject(self, user_id: str, name: str) -> Dict[str, Any]:
         try:
             db_utils.add_subject(user_id, name)
+            self.cache.invalidate("subjects", user_id)
             return {"success": True}
         except Exception as e:
             return {"success": False, "message": str(e)}
@@ -91,16 +312,20 @@ class DatabaseManager:
         subject_name: str | None = None,
         tags: str | None = None,
     ) -> Dict[str, Any]:
-        try:
-            # Build storage path
-            ts = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-            safe_name = file.name.replace(" ", "_")
-            file_path = f"{user_id}/{ts}_{safe_name}"
-
-            # Upload to storage (pass raw bytes, not BytesIO)
-            data = file.read()
-            db_utils.upload_file_to_storage(data, file_path)
+        result = self.upload_documents(user_id, [file], subject_name=subject_name, tags=tags)
+        if result["success"]:
+            return {"success": True}
+        return {"success": False, "message": result["failed"][0][1] if result["failed"] else result.get("message")}
 
+    def upload_documents(
+        self,
+        user_id: str,
+        files: List[Any],
+        subject_name: str | None = None,
+        tags: str | None = None,
+        on_progress: Callable[[Dict[int, tuple]], None] | None = None,
+    ) -> Dict[str, Any]:
+        try:
             # Resolve subject id if provided
             subject_id = None
             if subject_name:
@@ -110,21 +335,53 @@ class DatabaseManager:
                         subject_id = s.get("id")
                         break
 
-            # Insert metadata
-            metadata = {
-                "user_id": user_id,
-                "file_name": file.name,
-                "file_path": file_path,
-                "file_size": len(data),
-            }
             # Normalize tags to array for Postgres text[]
+            tag_list = None
             if tags is not None:
-                parts = [t.strip() for t in str(tags).split(",") if t.strip()]
-                metadata["tags"] = parts
-            if subject_id:
-                metadata["subject_id"] = subject_id
+                tag_list = [t.strip() for t in str(tags).split(",") if t.strip()]
 
-            db_utils.insert_document(metadata)
-            return {"success": True}
+            # Hash + store every file through a bounded worker pool
+            results = db_utils.store_files_concurrently(
+                files, user_id, max_workers=self.config.upload_workers, on_tick=on_progress
+            )
+
+            rows: List[Dict[str, Any]] = []
+            stored_ok: List[Dict[str, Any]] = []
+            failed: List[Tuple[str, str]] = []
+            for file, stored in zip(files, results):
+                if isinstance(stored, Exception):
+                    failed.append((file.name, str(stored)))
+                    continue
+                metadata = {
+                    "user_id": user_id,
+                    "file_name": file.name,
+                    "file_path": stored["file_path"],
+                    "file_size": stored["file_size"],
+                    "file_type": getattr(file, "type", None),
+                    "content_hash": stored["content_hash"],
+                }
+                if tag_list is not None:
+                    metadata["tags"] = tag_list
+                if subject_id:
+                    metadata["subject_id"] = subject_id
+                rows.append(metadata)
+                stored_ok.append(stored)
+
+            # One insert for the whole batch
+            try:
+                inserted = db_utils.insert_documents(rows)
+            except Exception:
+                for stored in stored_ok:
+                    db_utils.discard_stored_file(stored, user_id)
+                raise
+            self.cache.invalidate("documents", user_id)
+            # Text extraction runs on a background pool, off the request thread
+            extract.schedule_extraction(inserted or rows)
+            return {"success": not failed, "uploaded": len(rows), "failed": failed, "documents": inserted or rows}
         except Exception as e:
-            return {"success": False, "message": str(e)}
+            return {"success": False, "uploaded": 0, "failed": [], "documents": [], "message": str(e)}
+
+@st.cache_resource
+def get_database_manager() -> DatabaseManager:
+    """Process-wide DatabaseManager, so app.py and the standalone pages share one UserCache."""
+    return DatabaseManager(Config())
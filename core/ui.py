@@ -1,18 +1,85 @@
 from __future__ import annotations
+import html
+import threading
+from collections import OrderedDict
+from string import Template
 import streamlit as st
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Tuple
+from utils.grid import render_windowed_grid
+from utils.styles import STYLESHEET_PATH, apply_document_theme, inject_stylesheet, render_theme_switch
+
+# Rendered cards kept per (kind, id, updated_at, ...) so unchanged items are not re-templated
+FRAGMENT_CACHE_SIZE = 2048
+
+# Card templates are compiled once; every substituted value is HTML-escaped.
+# No indentation or blank lines: the payload goes through Markdown before it is rendered.
+_DOCUMENT_ROW = Template(
+    '<div class="glass-card" style="padding:0.75rem 1rem; margin-bottom:0.5rem;">'
+    '<div style="display:flex; justify-content:space-between; align-items:center;">'
+    '<div><div style="font-weight:600">$name</div>'
+    '<div style="color:#6c757d; font-size:0.85rem;">$subject · $tags</div></div>'
+    '<div style="color:#6c757d; font-size:0.85rem;">$created_at</div>'
+    '</div></div>'
+)
+_DOCUMENT_CARD = Template(
+    '<div class="glass-card" style="padding:1rem; margin:0;">'
+    '<div style="font-size:2rem">📄</div>'
+    '<div style="font-weight:600">$name</div>'
+    '<div style="color:#6c757d; font-size:0.85rem">$subject</div>'
+    '<div style="color:#6c757d; font-size:0.85rem">$tags</div>'
+    '</div>'
+)
+_SUBJECT_CARD = Template(
+    '<div class="glass-card" style="padding:1rem; margin:0;">'
+    '<div style="font-size:1.6rem">📚</div>'
+    '<div style="font-weight:600">$name</div>'
+    '</div>'
+)
+_GRID = Template(
+    '<div style="display:grid; grid-template-columns:repeat($columns, minmax(0, 1fr)); '
+    'gap:0.75rem; margin-bottom:0.75rem;">$cards</div>'
+)
+
+def _subject_name(d: Dict[str, Any]) -> str:
+    return (d.get("subjects") or {}).get("name") or ""
+
+def _tags_text(d: Dict[str, Any]) -> str:
+    tags = d.get("tags") or []
+    return ", ".join(tags) if isinstance(tags, list) else str(tags)
 
 class UIManager:
     def __init__(self) -> None:
-        pass
+        # Shared by every session (the manager is a cached resource)
+        self._fragments: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._fragments_lock = threading.Lock()
+
+    def _render_cached(self, template: Template, key: Tuple | None, fields: Callable[[], Dict[str, Any]]) -> str:
+        """Substitute `template` with escaped fields, memoized under `key` (None: not cacheable)."""
+        if key is not None:
+            with self._fragments_lock:
+                markup = self._fragments.get(key)
+                if markup is not None:
+                    self._fragments.move_to_end(key)
+                    return markup
+        markup = template.substitute({k: html.escape(str(v)) for k, v in fields().items()})
+        if key is not None:
+            with self._fragments_lock:
+                self._fragments[key] = markup
+                while len(self._fragments) > FRAGMENT_CACHE_SIZE:
+                    self._fragments.popitem(last=False)
+        return markup
+
+    @staticmethod
+    def _cache_key(kind: str, item: Dict[str, Any], *extra: Any) -> Tuple | None:
+        # Rows without updated_at (older schema / partial selects) are simply not memoized
+        if item.get("id") is None or not item.get("updated_at"):
+            return None
+        return (kind, item["id"], item["updated_at"]) + extra
 
     # ---------- Base helpers ----------
-    def load_css(self) -> None:
-        try:
-            with open("styles/custom.css", "r", encoding="utf-8") as f:
-                st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-        except Exception:
-            pass
+    def load_css(self, path: str = STYLESHEET_PATH) -> None:
+        """Minified stylesheet, read once per process and injected once per session."""
+        inject_stylesheet(path)
 
     def hide_sidebar(self) -> None:
         st.markdown(
@@ -25,33 +92,12 @@ class UIManager:
         )
 
     def apply_theme(self, theme: str) -> None:
-        """Apply theme by setting data-theme attribute on <html> element."""
-        safe_theme = "dark" if theme == "dark" else "light"
-        st.markdown(
-            f"""
-            <script>
-            (function() {{
-                try {{
-                    const el = document.documentElement;
-                    el.setAttribute('data-theme', '{safe_theme}');
-                    const app = document.querySelector('.stApp');
-                    if (app) {{
-                        app.setAttribute('data-theme', '{safe_theme}');
-                    }}
-                }} catch (e) {{}}
-            }})();
-            </script>
-            """,
-            unsafe_allow_html=True,
-        )
+        """Apply theme by setting data-theme attribute on <html>; the stylesheet switches via CSS variables."""
+        apply_document_theme(theme)
 
-    def render_theme_toggle(self, current: str = "light") -> str:
-        """Render a compact theme switcher; returns selected theme ('light'|'dark')."""
-        options = {"🌞 Sáng": "light", "🌙 Tối": "dark"}
-        labels = list(options.keys())
-        default_index = 0 if current != "dark" else 1
-        choice = st.selectbox("Giao diện", labels, index=default_index, key="theme_select", help="Chuyển chế độ sáng/tối")
-        return options.get(choice, "light")
+    def render_theme_toggle(self, current: str = "light") -> None:
+        """Render a compact, browser-side theme switcher (no rerun, no server round trip)."""
+        render_theme_switch(current)
 
     # ---------- Components ----------
     def render_user_info(self, email: str) -> None:
@@ -89,55 +135,86 @@ class UIManager:
         )
 
     def render_document_list(self, documents: List[Dict[str, Any]], show_actions: bool = False) -> None:
-        for d in documents:
-            st.markdown(
-                f"""
-                <div class="glass-card" style="padding:0.75rem 1rem; margin-bottom:0.5rem;">
-                    <div style="display:flex; justify-content:space-between; align-items:center;">
-                        <div>
-                            <div style="font-weight:600">{d.get('file_name','(Không tên)')}</div>
-                            <div style="color:#6c757d; font-size:0.85rem;">{d.get('subjects',{}).get('name','')} · {d.get('tags','')}</div>
-                        </div>
-                        <div style="color:#6c757d; font-size:0.85rem;">{d.get('created_at','')}</div>
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True,
+        rows = "".join(
+            self._render_cached(
+                _DOCUMENT_ROW,
+                # Subject renames do not touch the document row, so the embedded name is part of the key
+                self._cache_key("row", d, _subject_name(d)),
+                lambda d=d: {
+                    "name": d.get("file_name", "(Không tên)"),
+                    "subject": _subject_name(d),
+                    "tags": _tags_text(d),
+                    "created_at": d.get("created_at", ""),
+                },
+            )
+            for d in documents
+        )
+        if rows:
+            st.markdown(rows, unsafe_allow_html=True)
+
+    def render_document_grid(
+        self,
+        documents: List[Dict[str, Any]],
+        db_manager,
+        key: str = "documents_grid",
+        scope: Any = None,
+        has_more: Callable[[], bool] = lambda: False,
+        load_more: Callable[[], None] | None = None,
+    ) -> None:
+        """Windowed 3-column grid: only the first rows are rendered, more are revealed (and fetched) on demand."""
+        render_windowed_grid(
+            key,
+            documents,
+            columns=3,
+            scope=scope,
+            has_more=has_more,
+            load_more=load_more,
+            render_items=self._render_document_cards,
+        )
+
+    def _render_document_cards(self, documents: List[Dict[str, Any]]) -> None:
+        cards = "".join(
+            self._render_cached(
+                _DOCUMENT_CARD,
+                self._cache_key("card", d, _subject_name(d)),
+                lambda d=d: {
+                    "name": d.get("file_name", "(Không tên)"),
+                    "subject": _subject_name(d),
+                    "tags": _tags_text(d),
+                },
             )
+            for d in documents
+        )
+        if cards:
+            st.markdown(_GRID.substitute(columns=3, cards=cards), unsafe_allow_html=True)
 
-    def render_document_grid(self, documents: List[Dict[str, Any]], db_manager) -> None:
-        cols = st.columns(3)
-        for idx, d in enumerate(documents):
-            with cols[idx % 3]:
-                st.markdown(
-                    f"""
-                    <div class=\"glass-card\" style=\"padding:1rem; margin-bottom:0.75rem;\">
-                        <div style=\"font-size:2rem\">📄</div>
-                        <div style=\"font-weight:600\">{d.get('file_name','(Không tên)')}</div>
-                        <div style=\"color:#6c757d; font-size:0.85rem\">{d.get('subjects',{}).get('name','')}</div>
-                        <div style=\"color:#6c757d; font-size:0.85rem\">{d.get('tags','')}</div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+    def render_tag_cloud(self, tags: List[Dict[str, Any]]) -> None:
+        """Tags sized by how many documents use them."""
+        if not tags:
+            return
+        top = max(t.get("document_count", 0) for t in tags) or 1
+        spans = "".join(
+            f'<span class="tag" style="font-size:{0.8 + 0.7 * t.get("document_count", 0) / top:.2f}rem; margin:0.2rem;">'
+            f'{html.escape(t.get("name", ""))} <small>({t.get("document_count", 0)})</small></span>'
+            for t in tags
+        )
+        st.markdown(f'<div class="glass-card" style="padding:1rem;">{spans}</div>', unsafe_allow_html=True)
 
     def render_file_preview(self, uploaded_file) -> None:
-        size_kb = round(len(uploaded_file.getvalue()) / 1024, 1)
+        size_kb = round(uploaded_file.size / 1024, 1)
         st.info(f"📄 {uploaded_file.name} · {size_kb} KB")
 
     def render_subjects_grid(self, subjects: List[Dict[str, Any]], db_manager) -> None:
-        cols = st.columns(3)
-        for idx, s in enumerate(subjects):
-            with cols[idx % 3]:
-                st.markdown(
-                    f"""
-                    <div class=\"glass-card\" style=\"padding:1rem; margin-bottom:0.75rem;\">
-                        <div style=\"font-size:1.6rem\">📚</div>
-                        <div style=\"font-weight:600\">{s.get('name','(Không tên)')}</div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+        cards = "".join(
+            self._render_cached(
+                _SUBJECT_CARD,
+                self._cache_key("subject", s),
+                lambda s=s: {"name": s.get("name", "(Không tên)")},
+            )
+            for s in subjects
+        )
+        if cards:
+            st.markdown(_GRID.substitute(columns=3, cards=cards), unsafe_allow_html=True)
 
     def render_empty_state(self, icon: str, title: str, description: str) -> None:
         st.markdown(
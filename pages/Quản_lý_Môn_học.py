@@ -1,16 +1,11 @@
 # pages/Quản_lý_Môn_học.py
 import streamlit as st
 from utils import db, auth
+from utils.styles import inject_stylesheet
+from core.auth import get_auth_manager
 
-# Load custom CSS
-def load_css():
-    try:
-        with open('styles/custom.css') as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-    except:
-        pass
-
-load_css()
+# Stylesheet: đọc một lần cho cả process, gắn một lần cho mỗi session
+inject_stylesheet()
 
 # --- KIỂM TRA ĐĂNG NHẬP ---
 if not st.session_state.get("user_session"):
@@ -30,7 +25,8 @@ with st.sidebar:
     """, unsafe_allow_html=True)
     
     if st.button("🚪 Đăng xuất", key="logout_subjects", use_container_width=True, type="secondary"):
-        st.session_state.user_session = None
+        # Cùng đường đăng xuất với app.py: ngừng làm mới token, sign out, gỡ client của session
+        get_auth_manager().logout()
         st.rerun()
 
 # Modern header
@@ -62,9 +58,9 @@ with col1:
     """, unsafe_allow_html=True)
 
 with col2:
-    # Count documents per subject
-    documents = db.get_user_documents(user_id)
-    total_docs = len(documents)
+    # Số tài liệu theo môn học được gom nhóm trong database (không tải danh sách tài liệu)
+    subject_counts = db.get_subject_document_counts(user_id)
+    total_docs = sum(c['document_count'] for c in subject_counts.values())
     st.markdown(f"""
     <div class="glass-card" style="text-align: center; padding: 1.5rem;">
         <div style="font-size: 2.5rem; margin-bottom: 0.5rem;">📄</div>
@@ -137,13 +133,6 @@ else:
     st.markdown('<div class="main-container">', unsafe_allow_html=True)
     st.markdown("### 📋 Danh sách môn học")
     
-    # Count documents for each subject
-    subject_doc_count = {}
-    for doc in documents:
-        subject_id = doc.get('subject_id')
-        if subject_id:
-            subject_doc_count[subject_id] = subject_doc_count.get(subject_id, 0) + 1
-    
     # Display subjects in a grid
     for i in range(0, len(subjects_data), 2):
         cols = st.columns(2)
@@ -151,7 +140,7 @@ else:
         for j, col in enumerate(cols):
             if i + j < len(subjects_data):
                 subject = subjects_data[i + j]
-                doc_count = subject_doc_count.get(subject['id'], 0)
+                doc_count = subject_counts.get(subject['id'], {}).get('document_count', 0)
                 
                 with col:
                     # Modern subject card
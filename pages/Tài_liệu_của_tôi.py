@@ -1,17 +1,22 @@
 # pages/Tài_liệu_của_tôi.py
+import html
 import streamlit as st
-from utils import db, auth
+from utils import db, auth, extract, semantic
+from utils.styles import inject_stylesheet
+from core.auth import get_auth_manager
+from utils.pager import get_pager, ensure_first_page, load_next_page, remove_pager_item
+from utils.doc_index import get_document_index, remove_indexed_document
+from utils.grid import render_windowed_grid
+from core.config import Config
+from core.database import get_database_manager
 import pandas as pd
 
-# Load custom CSS
-def load_css():
-    try:
-        with open('styles/custom.css') as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-    except:
-        pass
+config = Config()
+# Đọc qua cache theo user dùng chung với app.py (tự xóa khi dữ liệu thay đổi)
+db_manager = get_database_manager()
 
-load_css()
+# Stylesheet: đọc một lần cho cả process, gắn một lần cho mỗi session
+inject_stylesheet()
 
 # --- KIỂM TRA ĐĂNG NHẬP ---
 if not st.session_state.get("user_session"):
@@ -31,11 +36,22 @@ with st.sidebar:
     """, unsafe_allow_html=True)
     
     if st.button("🚪 Đăng xuất", key="logout_main", use_container_width=True, type="secondary"):
-        st.session_state.user_session = None
+        # Cùng đường đăng xuất với app.py: ngừng làm mới token, sign out, gỡ client của session
+        get_auth_manager().logout()
         st.rerun()
 
-# --- LẤY DỮ LIỆU ---
-documents = db.get_user_documents(user_id)
+# Các danh sách tài liệu đã tải của trang (toàn bộ thư viện, kết quả tìm kiếm, kết quả lọc)
+LIBRARY_PAGERS = ("library_pager", "library_search_pager", "library_filter_pager")
+
+# --- LẤY DỮ LIỆU (phân trang theo keyset cursor) ---
+def fetch_page(cursor):
+    return db.get_user_documents_page(user_id, cursor=cursor)
+
+pager = get_pager("library_pager", user_id)
+ensure_first_page(pager, fetch_page)
+documents = pager["items"]
+# Chỉ mục tag / n-gram tên của session: xây một lần, sau đó chỉ thêm tài liệu mới tải
+library_index = get_document_index("library_index", documents, scope=(pager["scope"], id(pager)))
 
 # Modern header
 st.markdown("""
@@ -66,138 +82,261 @@ if not documents:
             auth.nav_page("Upload_Tài_liệu")
     st.stop()
 
-# --- MODERN SEARCH AND FILTER INTERFACE ---
-st.markdown('<div class="main-container">', unsafe_allow_html=True)
+def render_lazy_download(doc):
+    """Nút tải xuống chỉ ký URL / tải file khi được bấm."""
+    if not st.button("📥", key=f"download_{doc['id']}", help="Tải xuống", use_container_width=True):
+        return
+    try:
+        file_size = doc.get('file_size') or 0
+        if 0 < file_size <= config.inline_download_max_bytes:
+            st.download_button("💾", data=db.download_file(doc['file_path']), file_name=doc['file_name'],
+                               key=f"download_file_{doc['id']}", help="Lưu file", use_container_width=True)
+        else:
+            st.link_button("🔗", url=db.get_signed_url(doc['file_path']), help="Mở link tải xuống",
+                           use_container_width=True)
+    except Exception:
+        st.error("Lỗi link")
+
+# --- MODERN DOCUMENT CARDS ---
+# Chế độ "presign": ký link cho các thẻ đang hiển thị bằng một lần gọi (có cache theo file_path)
+# Chế độ "lazy": chỉ ký / tải file khi người dùng bấm nút tải xuống
+lazy_downloads = config.download_mode == "lazy"
+signed_urls = {}
+
+def sign_visible(visible_docs):
+    if lazy_downloads:
+        return
+    try:
+        signed_urls.update(db.get_signed_urls([d['file_path'] for d in visible_docs]))
+    except Exception:
+        pass
+
+@st.fragment
+def render_card(doc):
+    """Một thẻ tài liệu; các nút của thẻ chỉ chạy lại chính thẻ này."""
+    if st.session_state.get(f"deleted_{doc['id']}"):
+        st.success(f"🗑️ Đã xóa {doc['file_name']}")
+        return
+    
+    # Modern card design
+    subject_name = doc.get('subjects', {}).get('name') or "Chưa phân loại"
+    upload_date = pd.to_datetime(doc['created_at']).strftime('%d/%m/%Y')
+    file_size = f"{doc.get('file_size', 0) / 1024:.1f} KB" if doc.get('file_size') else "N/A"
 
-col1, col2, col3 = st.columns([2, 2, 1])
-with col1:
-    search_term = st.text_input("🔍 Tìm kiếm tài liệu", placeholder="Nhập tên file để tìm kiếm...")
+    # File type icon
+    file_ext = doc['file_name'].split('.')[-1].lower()
+    icon_map = {
+        'pdf': '📕',
+        'docx': '📘',
+        'doc': '📘',
+        'txt': '📄',
+        'xlsx': '📗',
+        'pptx': '📙'
+    }
+    file_icon = icon_map.get(file_ext, '📄')
 
-with col2:
-    all_tags = sorted(list(set(tag for doc in documents if doc['tags'] for tag in doc['tags'])))
-    selected_tags = st.multiselect("🏷️ Lọc theo tags", options=all_tags, placeholder="Chọn tags để lọc")
+    # Tên file, môn học và tag do người dùng nhập: escape trước khi chèn vào HTML
+    display_name = doc['file_name'][:30] + ('...' if len(doc['file_name']) > 30 else '')
+    display_name = html.escape(display_name)
+    subject_name = html.escape(subject_name)
 
-with col3:
-    st.markdown("<br>", unsafe_allow_html=True)
-    total_docs = len(documents)
-    st.metric("📊 Tổng số", total_docs)
+    card_html = f"""
+    <div class="glass-card animated-card" style="height: 280px; position: relative; overflow: hidden;">
+        <div style="display: flex; align-items: center; margin-bottom: 1rem;">
+            <div style="font-size: 2rem; margin-right: 0.5rem;">{file_icon}</div>
+            <div style="flex: 1;">
+                <h4 style="margin: 0; color: #667eea; font-size: 1.1rem; font-weight: 600; line-height: 1.3;">
+                    {display_name}
+                </h4>
+            </div>
+        </div>
 
-st.markdown('</div>', unsafe_allow_html=True)
+        <div style="margin-bottom: 1rem;">
+            <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
+                <span style="color: #6c757d; font-size: 0.85rem;">📚 Môn học:</span>
+                <span style="color: #667eea; font-weight: 500; font-size: 0.85rem;">{subject_name}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
+                <span style="color: #6c757d; font-size: 0.85rem;">📅 Ngày tải:</span>
+                <span style="color: #6c757d; font-size: 0.85rem;">{upload_date}</span>
+            </div>
+            <div style="display: flex; justify-content: space-between;">
+                <span style="color: #6c757d; font-size: 0.85rem;">💾 Kích thước:</span>
+                <span style="color: #6c757d; font-size: 0.85rem;">{file_size}</span>
+            </div>
+        </div>
+    """
 
-# Lọc dữ liệu
-filtered_data = documents
-if search_term:
-    filtered_data = [d for d in filtered_data if search_term.lower() in d['file_name'].lower()]
-if selected_tags:
-    filtered_data = [d for d in filtered_data if d['tags'] and set(selected_tags).issubset(set(d['tags']))]
+    # Tags
+    if doc['tags']:
+        tags_html = ""
+        for tag in doc['tags'][:3]:  # Limit to 3 tags
+            tags_html += f'<span class="tag" style="font-size: 0.75rem; padding: 0.2rem 0.5rem; margin: 0.1rem;">{html.escape(str(tag))}</span>'
+        if len(doc['tags']) > 3:
+            tags_html += f'<span style="color: #6c757d; font-size: 0.75rem;">+{len(doc["tags"]) - 3} more</span>'
+        card_html += f'<div style="margin-bottom: 1rem;">{tags_html}</div>'
 
-# Show filtered results count
-if len(filtered_data) != len(documents):
-    st.info(f"🔍 Hiển thị {len(filtered_data)} / {len(documents)} tài liệu")
+    card_html += "</div>"
 
-# --- MODERN DOCUMENT CARDS ---
-if filtered_data:
-    # Grid layout for cards
-    for i in range(0, len(filtered_data), 2):
-        cols = st.columns(2)
-        
-        for j, col in enumerate(cols):
-            if i + j < len(filtered_data):
-                doc = filtered_data[i + j]
-                
-                with col:
-                    # Modern card design
-                    subject_name = doc.get('subjects', {}).get('name') or "Chưa phân loại"
-                    upload_date = pd.to_datetime(doc['created_at']).strftime('%d/%m/%Y')
-                    file_size = f"{doc.get('file_size', 0) / 1024:.1f} KB" if doc.get('file_size') else "N/A"
-                    
-                    # File type icon
-                    file_ext = doc['file_name'].split('.')[-1].lower()
-                    icon_map = {
-                        'pdf': '📕',
-                        'docx': '📘',
-                        'doc': '📘',
-                        'txt': '📄',
-                        'xlsx': '📗',
-                        'pptx': '📙'
-                    }
-                    file_icon = icon_map.get(file_ext, '📄')
-                    
-                    card_html = f"""
-                    <div class="glass-card animated-card" style="height: 280px; position: relative; overflow: hidden;">
-                        <div style="display: flex; align-items: center; margin-bottom: 1rem;">
-                            <div style="font-size: 2rem; margin-right: 0.5rem;">{file_icon}</div>
-                            <div style="flex: 1;">
-                                <h4 style="margin: 0; color: #667eea; font-size: 1.1rem; font-weight: 600; line-height: 1.3;">
-                                    {doc['file_name'][:30]}{'...' if len(doc['file_name']) > 30 else ''}
-                                </h4>
-                            </div>
-                        </div>
-                        
-                        <div style="margin-bottom: 1rem;">
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                                <span style="color: #6c757d; font-size: 0.85rem;">📚 Môn học:</span>
-                                <span style="color: #667eea; font-weight: 500; font-size: 0.85rem;">{subject_name}</span>
-                            </div>
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                                <span style="color: #6c757d; font-size: 0.85rem;">📅 Ngày tải:</span>
-                                <span style="color: #6c757d; font-size: 0.85rem;">{upload_date}</span>
-                            </div>
-                            <div style="display: flex; justify-content: space-between;">
-                                <span style="color: #6c757d; font-size: 0.85rem;">💾 Kích thước:</span>
-                                <span style="color: #6c757d; font-size: 0.85rem;">{file_size}</span>
-                            </div>
-                        </div>
-                    """
-                    
-                    # Tags
-                    if doc['tags']:
-                        tags_html = ""
-                        for tag in doc['tags'][:3]:  # Limit to 3 tags
-                            tags_html += f'<span class="tag" style="font-size: 0.75rem; padding: 0.2rem 0.5rem; margin: 0.1rem;">{tag}</span>'
-                        if len(doc['tags']) > 3:
-                            tags_html += f'<span style="color: #6c757d; font-size: 0.75rem;">+{len(doc["tags"]) - 3} more</span>'
-                        card_html += f'<div style="margin-bottom: 1rem;">{tags_html}</div>'
-                    
-                    card_html += "</div>"
-                    
-                    st.markdown(card_html, unsafe_allow_html=True)
-                    
-                    # Action buttons
-                    btn_col1, btn_col2, btn_col3 = st.columns(3)
-                    
-                    with btn_col1:
-                        try:
-                            res = db.supabase.storage.from_('document_files').create_signed_url(doc['file_path'], 60)
-                            st.link_button("📥", url=res['signedURL'], 
-                                         help="Tải xuống", use_container_width=True)
-                        except Exception as e:
-                            st.button("❌", disabled=True, help="Lỗi link", use_container_width=True)
-                    
-                    with btn_col2:
-                        edit_button = st.button("✏️", key=f"edit_{doc['id']}", 
-                                   help="Chỉnh sửa", use_container_width=True)
-                        if edit_button:
-                            st.session_state.selected_document_id = doc['id']
-                            auth.nav_page("_Chỉnh_sửa_tài_liệu")
-                    
-                    with btn_col3:
-                        if st.button("🗑️", key=f"delete_{doc['id']}", 
-                                   help="Xóa tài liệu", use_container_width=True, type="primary"):
-                            if st.session_state.get(f"confirm_delete_{doc['id']}", False):
-                                with st.spinner("Đang xóa..."):
-                                    db.delete_document(doc['id'], doc['file_path'])
-                                    st.success("Đã xóa tài liệu!")
-                                    st.rerun()
-                            else:
-                                st.session_state[f"confirm_delete_{doc['id']}"] = True
-                                st.warning("Nhấn lại để xác nhận xóa")
-                                st.rerun()
-else:
-    st.markdown("""
-    <div class="main-container" style="text-align: center; padding: 2rem;">
-        <div style="font-size: 3rem; margin-bottom: 1rem;">🔍</div>
-        <h3 style="color: #667eea;">Không tìm thấy tài liệu</h3>
-        <p style="color: #6c757d;">Thử thay đổi từ khóa tìm kiếm hoặc bộ lọc</p>
-    </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown(card_html, unsafe_allow_html=True)
+
+    # Action buttons
+    btn_col1, btn_col2, btn_col3 = st.columns(3)
+
+    with btn_col1:
+        if lazy_downloads:
+            render_lazy_download(doc)
+        elif signed_urls.get(doc['file_path']):
+            st.link_button("📥", url=signed_urls[doc['file_path']], 
+                         help="Tải xuống", use_container_width=True)
+        else:
+            st.button("❌", disabled=True, help="Lỗi link", use_container_width=True, key=f"nolink_{doc['id']}")
+
+    with btn_col2:
+        edit_button = st.button("✏️", key=f"edit_{doc['id']}", 
+                   help="Chỉnh sửa", use_container_width=True)
+        if edit_button:
+            st.session_state.selected_document_id = doc['id']
+            auth.nav_page("_Chỉnh_sửa_tài_liệu")
+
+    with btn_col3:
+        if st.button("🗑️", key=f"delete_{doc['id']}", 
+                   help="Xóa tài liệu", use_container_width=True, type="primary"):
+            if st.session_state.get(f"confirm_delete_{doc['id']}", False):
+                with st.spinner("Đang xóa..."):
+                    db.delete_document(doc['id'], doc['file_path'])
+                    for key in LIBRARY_PAGERS:
+                        remove_pager_item(key, doc['id'])
+                    remove_indexed_document("library_index", doc['id'])
+                    remove_indexed_document("library_search_index", doc['id'])
+                    st.session_state[f"deleted_{doc['id']}"] = True
+            else:
+                st.session_state[f"confirm_delete_{doc['id']}"] = True
+            st.rerun(scope="fragment")
+    
+    if st.session_state.get(f"confirm_delete_{doc['id']}", False):
+        st.warning("Nhấn 🗑️ lần nữa để xác nhận xóa")
+
+@st.fragment
+def render_library():
+    """Thanh lọc + lưới kết quả; đổi bộ lọc chỉ chạy lại phần này, không chạy lại cả trang."""
+    # --- MODERN SEARCH AND FILTER INTERFACE ---
+    st.markdown('<div class="main-container">', unsafe_allow_html=True)
+
+    subjects = db.get_user_subjects(user_id)
+    subject_ids = {s['name']: s['id'] for s in subjects}
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        search_term = st.text_input("🔍 Tìm kiếm tài liệu", placeholder="Nhập tên file để tìm kiếm...")
+        # Chỉ đưa ra các chế độ tìm có dữ liệu trên máy chủ này
+        search_modes = ["Tên, tags, môn học", "Nội dung file", "Ngữ nghĩa (AI)"]
+        if not extract.extraction_enabled():
+            search_modes.remove("Nội dung file")
+            st.caption("ℹ️ Tìm trong nội dung file chưa khả dụng: máy chủ chưa bật trích xuất nội dung.")
+        if not semantic.semantic_search_enabled():
+            search_modes.remove("Ngữ nghĩa (AI)")
+            st.caption("ℹ️ Tìm kiếm ngữ nghĩa chưa khả dụng: máy chủ chưa bật tạo embedding.")
+        search_mode = st.radio("Tìm trong", search_modes, horizontal=True,
+                               label_visibility="collapsed", key="library_search_mode")
+
+    with col2:
+        # Danh sách tag đọc từ bảng tags chuẩn hóa (đủ cả tag của các trang chưa tải)
+        try:
+            all_tags = sorted(t['name'] for t in db_manager.get_tag_cloud(user_id))
+        except Exception:
+            all_tags = library_index.all_tags()
+        selected_tags = st.multiselect("🏷️ Lọc theo tags", options=all_tags, placeholder="Chọn tags để lọc")
+        selected_subject = st.selectbox("📚 Môn học", options=["Tất cả"] + list(subject_ids))
+        subject_id = subject_ids.get(selected_subject)
+
+    with col3:
+        st.markdown("<br>", unsafe_allow_html=True)
+        total_docs = db.count_user_documents(user_id) if pager["has_more"] else len(pager["items"])
+        st.metric("📊 Tổng số", total_docs)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # Lọc dữ liệu. Khi đã tải hết thư viện, từ khóa (tên file, tags, môn học), tags và môn học lọc ngay trên
+    # chỉ mục của session. Nếu chưa, từ khóa tìm full-text phía server theo độ liên quan (cùng tên, tags, môn học),
+    # kèm bộ lọc tags/môn học trong cùng RPC; không có từ khóa thì tags/môn học lọc trên bảng documents
+    # (GIN index cho tags); từng trang một
+    search_term = search_term.strip()
+    active_pager, active_fetch = pager, fetch_page
+    name_mode = search_mode == "Tên, tags, môn học"
+
+    def matches_subject(doc):
+        return subject_id is None or doc.get('subject_id') == subject_id
+
+    if name_mode and not pager["has_more"]:
+        filtered_data = [d for d in library_index.filter(tags=selected_tags, query=search_term) if matches_subject(d)]
+    elif name_mode and not search_term and (selected_tags or subject_id is not None):
+        def fetch_filtered_page(cursor):
+            return db.get_user_documents_page(user_id, cursor=cursor, tags=selected_tags, subject_id=subject_id)
+    
+        active_pager = get_pager("library_filter_pager", (user_id, tuple(selected_tags), subject_id))
+        active_fetch = fetch_filtered_page
+        ensure_first_page(active_pager, active_fetch)
+        filtered_data = active_pager["items"]
+    elif search_term:
+        def fetch_search_page(cursor):
+            if search_mode == "Ngữ nghĩa (AI)":
+                return semantic.semantic_search(user_id, search_term)
+            if search_mode == "Nội dung file":
+                return db.search_document_contents(user_id, search_term, cursor=cursor,
+                                                   tags=selected_tags, subject_id=subject_id)
+            return db.search_documents(user_id, search_term, cursor=cursor, tags=selected_tags, subject_id=subject_id)
+    
+        active_pager = get_pager("library_search_pager",
+                                 (user_id, search_term, search_mode, tuple(selected_tags), subject_id))
+        active_fetch = fetch_search_page
+        try:
+            ensure_first_page(active_pager, active_fetch)
+        except Exception as e:
+            # Lỗi API embedding / RPC tìm kiếm: báo lỗi thay vì làm hỏng cả phần thư viện
+            st.error(f"❌ Không tìm kiếm được: {e}")
+        if search_mode == "Ngữ nghĩa (AI)":
+            # Tìm kiếm ngữ nghĩa trả về một trang các đoạn gần nhất: tags/môn học lọc trên trang đó
+            active_index = get_document_index("library_search_index", active_pager["items"],
+                                              scope=(active_pager["scope"], id(active_pager)))
+            filtered_data = [d for d in active_index.filter(tags=selected_tags) if matches_subject(d)]
+        else:
+            # Tags/môn học đã được lọc cùng từ khóa phía server, trước khi phân trang
+            filtered_data = active_pager["items"]
+    else:
+        filtered_data = [d for d in library_index.filter(tags=selected_tags) if matches_subject(d)]
+
+    # Show filtered results count
+    if len(filtered_data) != total_docs:
+        st.info(f"🔍 Hiển thị {len(filtered_data)} / {total_docs} tài liệu")
+
+    if filtered_data:
+        # Chỉ render các hàng đầu tiên; "Hiển thị thêm" mở rộng dần và tải trang kế tiếp khi cần
+        render_windowed_grid(
+            "library_grid",
+            filtered_data,
+            render_card,
+            columns=2,
+            scope=(active_pager["scope"], tuple(selected_tags), subject_id, search_term),
+            has_more=lambda: active_pager["has_more"],
+            load_more=lambda: load_next_page(active_pager, active_fetch),
+            prepare=sign_visible,
+        )
+    else:
+        st.markdown("""
+        <div class="main-container" style="text-align: center; padding: 2rem;">
+            <div style="font-size: 3rem; margin-bottom: 1rem;">🔍</div>
+            <h3 style="color: #667eea;">Không tìm thấy tài liệu</h3>
+            <p style="color: #6c757d;">Thử thay đổi từ khóa tìm kiếm hoặc bộ lọc</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+        # Các trang chưa tải vẫn có thể có kết quả
+        if active_pager["has_more"]:
+            col1, col2, col3 = st.columns([1, 1, 1])
+            with col2:
+                if st.button("⬇️ Tải thêm tài liệu", key="library_load_more", use_container_width=True):
+                    load_next_page(active_pager, active_fetch)
+                    st.rerun()
+
+render_library()
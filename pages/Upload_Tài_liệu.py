@@ -1,17 +1,16 @@
 # pages/Upload_Tài_liệu.py
 import streamlit as st
 from utils import db, auth
-import time
+from utils.styles import inject_stylesheet
+from core.auth import get_auth_manager
+from utils.pager import reset_pager
+from core.database import get_database_manager
 
-# Load custom CSS
-def load_css():
-    try:
-        with open('styles/custom.css') as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-    except:
-        pass
+# Đọc qua cache theo user dùng chung với app.py (tự xóa khi dữ liệu thay đổi)
+db_manager = get_database_manager()
 
-load_css()
+# Stylesheet: đọc một lần cho cả process, gắn một lần cho mỗi session
+inject_stylesheet()
 
 # --- KIỂM TRA ĐĂNG NHẬP ---
 if not st.session_state.get("user_session"):
@@ -31,7 +30,8 @@ with st.sidebar:
     """, unsafe_allow_html=True)
     
     if st.button("🚪 Đăng xuất", key="logout_upload", use_container_width=True, type="secondary"):
-        st.session_state.user_session = None
+        # Cùng đường đăng xuất với app.py: ngừng làm mới token, sign out, gỡ client của session
+        get_auth_manager().logout()
         st.rerun()
 
 # Modern header
@@ -57,26 +57,27 @@ with st.form("upload_form", clear_on_submit=True):
     st.markdown("### 📁 Chọn tài liệu")
     
     # Enhanced file uploader with custom styling
-    uploaded_file = st.file_uploader(
+    uploaded_files = st.file_uploader(
         "Kéo thả file vào đây hoặc click để chọn",
         type=['pdf', 'docx', 'txt', 'xlsx', 'pptx'],
-        help="Hỗ trợ các định dạng: PDF, DOCX, TXT, XLSX, PPTX"
+        accept_multiple_files=True,
+        help="Hỗ trợ các định dạng: PDF, DOCX, TXT, XLSX, PPTX - có thể chọn nhiều file"
     )
     
-    if uploaded_file:
+    # File type icon
+    icon_map = {
+        'PDF': '📕',
+        'DOCX': '📘',
+        'DOC': '📘',
+        'TXT': '📄',
+        'XLSX': '📗',
+        'PPTX': '📙'
+    }
+    
+    for uploaded_file in uploaded_files or []:
         # File preview
         file_size_mb = uploaded_file.size / (1024 * 1024)
         file_ext = uploaded_file.name.split('.')[-1].upper()
-        
-        # File type icon
-        icon_map = {
-            'PDF': '📕',
-            'DOCX': '📘',
-            'DOC': '📘',
-            'TXT': '📄',
-            'XLSX': '📗',
-            'PPTX': '📙'
-        }
         file_icon = icon_map.get(file_ext, '📄')
         
         st.markdown(f"""
@@ -118,6 +119,12 @@ with st.form("upload_form", clear_on_submit=True):
             placeholder="ví dụ: bài giảng, thi cuối kỳ, quan trọng",
             help="Cách nhau bởi dấu phẩy để dễ tìm kiếm sau này"
         )
+        try:
+            popular_tags = db_manager.get_tag_cloud(user_id, limit=8)
+        except Exception:
+            popular_tags = []
+        if popular_tags:
+            st.caption("💡 Tags hay dùng: " + ", ".join(t['name'] for t in popular_tags))
         
         # Tag suggestions
         if tags_input:
@@ -135,73 +142,77 @@ with st.form("upload_form", clear_on_submit=True):
     with col_btn2:
         submitted = st.form_submit_button("🚀 Upload Tài liệu", use_container_width=True)
     
-    if submitted and uploaded_file is not None:
+    if submitted and uploaded_files:
         # Progress animation
         progress_bar = st.progress(0)
         status_text = st.empty()
         
         try:
-            # Step 1: Validate file
-            status_text.text("🔍 Đang kiểm tra file...")
-            progress_bar.progress(20)
-            time.sleep(0.5)
-            
-            file_bytes = uploaded_file.getvalue()
-            file_name = uploaded_file.name
-            file_path = f"{user_id}/{file_name}"
+            # Tiến trình tổng = số byte đã gửi (90%) + lưu metadata (10%)
+            total_bytes = sum(f.size for f in uploaded_files) or 1
+            status_text.text(f"☁️ Đang upload {len(uploaded_files)} file lên cloud...")
+            file_bars = [st.progress(0, text=f"📄 {f.name}") for f in uploaded_files]
             
-            # Step 2: Upload to storage
-            status_text.text("☁️ Đang upload lên cloud...")
-            progress_bar.progress(50)
+            def show_file_progress(progress):
+                for index, (sent, total) in progress.items():
+                    file_bars[index].progress(min(sent / total, 1.0) if total else 1.0, text=f"📄 {uploaded_files[index].name}")
+                sent_bytes = sum(sent for sent, _ in progress.values())
+                progress_bar.progress(min(int(sent_bytes * 90 / total_bytes), 90))
             
-            db.upload_file_to_storage(file_bytes, file_path)
-            time.sleep(0.5)
-            
-            # Step 3: Save metadata
-            status_text.text("💾 Đang lưu thông tin...")
-            progress_bar.progress(80)
+            # Upload song song (bỏ qua file có nội dung đã tồn tại), lưu metadata bằng một lệnh insert
+            # và đưa việc trích xuất nội dung vào hàng đợi chạy nền
+            result = db_manager.upload_documents(
+                user_id,
+                uploaded_files,
+                subject_name=selected_subject_name or None,
+                tags=tags_input,
+                on_progress=show_file_progress,
+            )
+            rows = result["documents"]
+            failed = list(result["failed"])
+            if result.get("message"):
+                failed.append(("Tất cả file", result["message"]))
+            if rows:
+                reset_pager("library_pager")
             
             tags_list = [tag.strip() for tag in tags_input.split(',') if tag.strip()]
-            metadata = {
-                "user_id": user_id,
-                "subject_id": subject_map.get(selected_subject_name),
-                "file_name": file_name,
-                "file_path": file_path,
-                "file_size": uploaded_file.size,
-                "file_type": uploaded_file.type,
-                "tags": tags_list
-            }
-            
-            db.insert_document(metadata)
-            
-            # Step 4: Complete
             progress_bar.progress(100)
-            status_text.text("✅ Hoàn thành!")
-            time.sleep(0.5)
-            
-            # Success message with animation
-            st.success("🎉 Upload tài liệu thành công!")
-            st.balloons()
+            failure_lines = "\n".join(f"- {file_name}: {error}" for file_name, error in failed)
             
-            # Show summary
-            st.markdown(f"""
-            <div class="glass-card" style="margin-top: 1rem;">
-                <h4 style="color: #28a745; margin-bottom: 1rem;">📋 Tóm tắt upload</h4>
-                <div style="display: grid; grid-template-columns: 1fr 2fr; gap: 0.5rem; font-size: 0.9rem;">
-                    <span style="color: #6c757d;">📄 Tên file:</span>
-                    <span style="font-weight: 500;">{file_name}</span>
-                    
-                    <span style="color: #6c757d;">📚 Môn học:</span>
-                    <span style="font-weight: 500;">{selected_subject_name or 'Chưa phân loại'}</span>
-                    
-                    <span style="color: #6c757d;">🏷️ Tags:</span>
-                    <span style="font-weight: 500;">{', '.join(tags_list) if tags_list else 'Không có'}</span>
-                    
-                    <span style="color: #6c757d;">💾 Kích thước:</span>
-                    <span style="font-weight: 500;">{file_size_mb:.2f} MB</span>
+            if not rows:
+                status_text.text("❌ Upload thất bại")
+                st.error(f"❌ Không upload được file nào:\n\n{failure_lines}")
+            else:
+                status_text.text("✅ Hoàn thành!")
+                
+                uploaded_names = [r["file_name"] for r in rows]
+                total_size_mb = sum(r["file_size"] for r in rows) / (1024 * 1024)
+                
+                # Success message with animation
+                st.success(f"🎉 Upload thành công {len(rows)} tài liệu!")
+                st.balloons()
+                if failed:
+                    st.warning(f"⚠️ {len(failed)} file upload thất bại:\n\n{failure_lines}")
+                
+                # Show summary
+                st.markdown(f"""
+                <div class="glass-card" style="margin-top: 1rem;">
+                    <h4 style="color: #28a745; margin-bottom: 1rem;">📋 Tóm tắt upload</h4>
+                    <div style="display: grid; grid-template-columns: 1fr 2fr; gap: 0.5rem; font-size: 0.9rem;">
+                        <span style="color: #6c757d;">📄 Tên file:</span>
+                        <span style="font-weight: 500;">{'<br>'.join(uploaded_names)}</span>
+                        
+                        <span style="color: #6c757d;">📚 Môn học:</span>
+                        <span style="font-weight: 500;">{selected_subject_name or 'Chưa phân loại'}</span>
+                        
+                        <span style="color: #6c757d;">🏷️ Tags:</span>
+                        <span style="font-weight: 500;">{', '.join(tags_list) if tags_list else 'Không có'}</span>
+                        
+                        <span style="color: #6c757d;">💾 Kích thước:</span>
+                        <span style="font-weight: 500;">{total_size_mb:.2f} MB</span>
+                    </div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
             
             # Quick actions
             st.markdown("### 🚀 Tiếp theo?")
@@ -224,7 +235,7 @@ with st.form("upload_form", clear_on_submit=True):
             status_text.text("")
             st.error(f"❌ Lỗi upload: {str(e)}")
             
-    elif submitted and uploaded_file is None:
+    elif submitted and not uploaded_files:
         st.warning("⚠️ Vui lòng chọn file để upload!")
 
 st.markdown('</div>', unsafe_allow_html=True)
@@ -1,18 +1,14 @@
 # pages/_Chỉnh_sửa_tài_liệu.py
 import streamlit as st
 from utils import db, auth
+from utils.styles import inject_stylesheet
+from core.auth import get_auth_manager
+from utils.doc_index import update_indexed_document
+from utils.pager import update_pager_item, reset_pager
 import pandas as pd
-import time
 
-# Load custom CSS
-def load_css():
-    try:
-        with open('styles/custom.css') as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-    except:
-        pass
-
-load_css()
+# Stylesheet: đọc một lần cho cả process, gắn một lần cho mỗi session
+inject_stylesheet()
 
 # --- KIỂM TRA ĐĂNG NHẬP VÀ SESSION STATE ---
 if not st.session_state.get("user_session"):
@@ -32,7 +28,8 @@ with st.sidebar:
     """, unsafe_allow_html=True)
     
     if st.button("🚪 Đăng xuất", key="logout_edit", use_container_width=True, type="secondary"):
-        st.session_state.user_session = None
+        # Cùng đường đăng xuất với app.py: ngừng làm mới token, sign out, gỡ client của session
+        get_auth_manager().logout()
         st.rerun()
 
 if "doc_to_edit" not in st.session_state or st.session_state.doc_to_edit is None:
@@ -213,10 +210,8 @@ with st.form("edit_form"):
         status_text = st.empty()
         
         try:
-            # Step 1: Validate changes
+            # Tiến trình theo số bước thực sự đã xong: kiểm tra → lưu → hoàn tất
             status_text.text("🔍 Đang kiểm tra thay đổi...")
-            progress_bar.progress(25)
-            time.sleep(0.3)
             
             new_subject_id = subject_map.get(new_subject_name)
             new_tags_list = [tag.strip() for tag in new_tags_str.split(',') if tag.strip()]
@@ -230,30 +225,30 @@ with st.form("edit_form"):
                 status_text.text("")
                 st.info("ℹ️ Không có thay đổi nào để lưu")
             else:
-                # Step 2: Prepare updates
-                status_text.text("📝 Đang chuẩn bị cập nhật...")
-                progress_bar.progress(50)
-                time.sleep(0.3)
-                
+                progress_bar.progress(33)
                 updates = {
                     "subject_id": new_subject_id,
                     "tags": new_tags_list
                 }
                 
-                # Step 3: Save to database
+                # Save to database
                 status_text.text("💾 Đang lưu vào cơ sở dữ liệu...")
-                progress_bar.progress(75)
-                
                 db.update_document_metadata(doc_id, updates)
-                time.sleep(0.3)
                 
-                # Step 4: Complete
+                # Cập nhật tại chỗ danh sách + chỉ mục của thư viện, không phải tải lại
+                updated_doc = {**doc_data, **updates, "subjects": {"name": new_subject_name} if new_subject_name else None}
+                for key in ("library_pager", "library_search_pager"):
+                    update_pager_item(key, updated_doc)
+                for key in ("library_index", "library_search_index"):
+                    update_indexed_document(key, updated_doc)
+                # Tài liệu có thể không còn khớp bộ lọc tags/môn học phía server: tải lại kết quả lọc
+                reset_pager("library_filter_pager")
+                
                 progress_bar.progress(100)
                 status_text.text("✅ Hoàn thành!")
-                time.sleep(0.5)
                 
                 # Success message
-                st.success("🎉 Cập nhật thành công!")
+                st.success("🎉 Cập nhật thành công! Đang quay về thư viện tài liệu...")
                 st.balloons()
                 
                 # Show summary of changes
@@ -270,11 +265,7 @@ with st.form("edit_form"):
                 </div>
                 """, unsafe_allow_html=True)
                 
-                # Auto redirect after 3 seconds
-                with st.spinner("Sẽ quay về thư viện tài liệu trong 3 giây..."):
-                    time.sleep(3)
-                
-                # Clean up and redirect
+                # Clean up and redirect; việc chuyển trang chạy phía trình duyệt nên không giữ thread của script
                 del st.session_state.doc_to_edit
                 auth.nav_page("Tài_liệu_của_tôi")
                 
@@ -0,0 +1,4 @@
+-- Keyset pagination for the document library: (user_id, created_at desc, id desc)
+-- matches the ORDER BY used by utils.db.get_user_documents_page.
+create index if not exists documents_user_created_id_idx
+    on public.documents (user_id, created_at desc, id desc);
@@ -0,0 +1,25 @@
+-- Dashboard aggregates for DatabaseManager.get_user_statistics, computed
+-- server-side so the home page does not download every document row.
+create or replace function public.get_user_statistics(p_user_id uuid)
+returns table (
+    total_documents bigint,
+    total_subjects bigint,
+    total_tags bigint,
+    total_size_bytes bigint
+)
+language sql
+stable
+security invoker
+as $$
+    select
+        (select count(*) from public.documents d where d.user_id = p_user_id),
+        (select count(*) from public.subjects s where s.user_id = p_user_id),
+        (select count(distinct nullif(btrim(t), ''))
+           from public.documents d, unnest(d.tags) as t
+          where d.user_id = p_user_id),
+        (select coalesce(sum(d.file_size), 0)::bigint
+           from public.documents d
+          where d.user_id = p_user_id);
+$$;
+
+grant execute on function public.get_user_statistics(uuid) to authenticated;
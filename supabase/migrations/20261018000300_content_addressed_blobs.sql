@@ -0,0 +1,77 @@
+-- Content-addressed storage: identical uploads share one object under
+-- cas/<aa>/<sha256>, and documents reference it through content_hash.
+create table if not exists public.storage_blobs (
+    sha256     text primary key,
+    file_path  text not null unique,
+    file_size  bigint not null,
+    ref_count  integer not null default 0 check (ref_count >= 0),
+    created_at timestamptz not null default now()
+);
+
+alter table public.storage_blobs enable row level security;
+
+alter table public.documents
+    add column if not exists content_hash text references public.storage_blobs (sha256);
+
+create index if not exists documents_content_hash_idx on public.documents (content_hash);
+
+-- Take a reference on a blob, creating it if needed. "created" tells the
+-- caller whether it must upload the bytes.
+create or replace function public.acquire_blob(p_sha256 text, p_file_path text, p_file_size bigint)
+returns table (file_path text, created boolean)
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    return query
+    insert into public.storage_blobs as b (sha256, file_path, file_size, ref_count)
+    values (p_sha256, p_file_path, p_file_size, 1)
+    on conflict (sha256) do update set ref_count = b.ref_count + 1
+    returning b.file_path, (xmax = 0);
+end;
+$$;
+
+-- Drop a reference; the row goes away with the last one and the caller
+-- removes the storage object when remaining = 0.
+create or replace function public.release_blob(p_sha256 text)
+returns table (file_path text, remaining integer)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_path text;
+    v_count integer;
+begin
+    update public.storage_blobs b
+       set ref_count = greatest(b.ref_count - 1, 0)
+     where b.sha256 = p_sha256
+    returning b.file_path, b.ref_count into v_path, v_count;
+
+    if v_count = 0 then
+        delete from public.storage_blobs b where b.sha256 = p_sha256 and b.ref_count = 0;
+    end if;
+
+    return query select v_path, coalesce(v_count, 0);
+end;
+$$;
+
+grant execute on function public.acquire_blob(text, text, bigint) to authenticated;
+grant execute on function public.release_blob(text) to authenticated;
+
+-- Shared blobs are readable by any user who has a document pointing at them.
+create policy "cas blobs readable by referencing users"
+    on storage.objects for select to authenticated
+    using (
+        bucket_id = 'document_files'
+        and (storage.foldername(name))[1] = 'cas'
+        and exists (
+            select 1 from public.documents d
+             where d.file_path = storage.objects.name and d.user_id = auth.uid()
+        )
+    );
+
+create policy "cas blobs writable by authenticated users"
+    on storage.objects for insert to authenticated
+    with check (bucket_id = 'document_files' and (storage.foldername(name))[1] = 'cas');
@@ -0,0 +1,145 @@
+-- Full-text search over file name, tags and subject name with
+-- Vietnamese-diacritic-insensitive matching (unaccent + 'simple' config).
+create extension if not exists unaccent with schema extensions;
+
+-- unaccent() is only STABLE; this wrapper pins the dictionary so it can be
+-- used in triggers and indexes. đ/Đ are folded explicitly.
+create or replace function public.vn_unaccent(p_text text)
+returns text
+language sql
+immutable
+parallel safe
+set search_path = public, extensions
+as $$
+    select lower(extensions.unaccent('extensions.unaccent'::regdictionary,
+                 translate(coalesce(p_text, ''), 'đĐ', 'dD')));
+$$;
+
+-- Prefix query: every word of the input must match the start of a lexeme.
+create or replace function public.vn_prefix_tsquery(p_query text)
+returns tsquery
+language sql
+immutable
+parallel safe
+as $$
+    select to_tsquery('simple', string_agg(quote_literal(lexeme) || ':*', ' & '))
+      from unnest(tsvector_to_array(to_tsvector('simple', public.vn_unaccent(p_query)))) as lexeme;
+$$;
+
+create or replace function public.documents_search_vector(p_file_name text, p_tags text[], p_subject_name text)
+returns tsvector
+language sql
+immutable
+parallel safe
+as $$
+    select setweight(to_tsvector('simple', public.vn_unaccent(regexp_replace(p_file_name, '[_.\-/]+', ' ', 'g'))), 'A')
+        || setweight(to_tsvector('simple', public.vn_unaccent(array_to_string(p_tags, ' '))), 'B')
+        || setweight(to_tsvector('simple', public.vn_unaccent(p_subject_name)), 'C');
+$$;
+
+-- Kept out of public.documents so select('*') payloads stay small.
+create table if not exists public.document_search (
+    document_id   bigint primary key references public.documents (id) on delete cascade,
+    user_id       uuid not null,
+    search_vector tsvector not null
+);
+
+alter table public.document_search enable row level security;
+
+create policy "document_search owned by user"
+    on public.document_search for select to authenticated
+    using (user_id = auth.uid());
+
+create index if not exists document_search_vector_idx
+    on public.document_search using gin (search_vector);
+create index if not exists document_search_user_idx
+    on public.document_search (user_id);
+
+create or replace function public.documents_search_vector_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.document_search (document_id, user_id, search_vector)
+    values (
+        new.id,
+        new.user_id,
+        public.documents_search_vector(
+            new.file_name,
+            new.tags,
+            (select s.name from public.subjects s where s.id = new.subject_id))
+    )
+    on conflict (document_id) do update
+        set user_id = excluded.user_id,
+            search_vector = excluded.search_vector;
+    return null;
+end;
+$$;
+
+drop trigger if exists documents_search_vector_update on public.documents;
+create trigger documents_search_vector_update
+    after insert or update of file_name, tags, subject_id on public.documents
+    for each row execute function public.documents_search_vector_trigger();
+
+-- Renaming a subject re-indexes its documents.
+create or replace function public.subjects_search_vector_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    update public.document_search ds
+       set search_vector = public.documents_search_vector(d.file_name, d.tags, new.name)
+      from public.documents d
+     where d.id = ds.document_id
+       and d.subject_id = new.id;
+    return null;
+end;
+$$;
+
+drop trigger if exists subjects_search_vector_update on public.subjects;
+create trigger subjects_search_vector_update
+    after update of name on public.subjects
+    for each row execute function public.subjects_search_vector_trigger();
+
+-- Backfill existing rows.
+insert into public.document_search (document_id, user_id, search_vector)
+select d.id,
+       d.user_id,
+       public.documents_search_vector(d.file_name, d.tags, s.name)
+  from public.documents d
+  left join public.subjects s on s.id = d.subject_id
+on conflict (document_id) do update set search_vector = excluded.search_vector;
+
+-- Ranked search returning rows shaped like select('*, subjects(name)'),
+-- plus a "rank" field. Callers page with limit/offset.
+create or replace function public.search_documents(
+    p_user_id uuid,
+    p_query text,
+    p_limit integer default 50,
+    p_offset integer default 0
+)
+returns setof jsonb
+language sql
+stable
+security invoker
+as $$
+    with q as (select public.vn_prefix_tsquery(p_query) as query)
+    select to_jsonb(d)
+           || jsonb_build_object(
+                  'subjects', case when s.id is null then null else jsonb_build_object('name', s.name) end,
+                  'rank', ts_rank_cd(ds.search_vector, q.query))
+      from public.document_search ds
+      cross join q
+      join public.documents d on d.id = ds.document_id
+      left join public.subjects s on s.id = d.subject_id
+     where ds.user_id = p_user_id
+       and ds.search_vector @@ q.query
+     order by ts_rank_cd(ds.search_vector, q.query) desc, d.created_at desc, d.id desc
+     limit p_limit offset p_offset;
+$$;
+
+grant execute on function public.search_documents(uuid, text, integer, integer) to authenticated;
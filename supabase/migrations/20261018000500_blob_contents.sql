@@ -0,0 +1,59 @@
+-- Extracted text of uploaded files, keyed by content hash so identical
+-- uploads are extracted and indexed once (see storage_blobs).
+create table if not exists public.blob_contents (
+    content_hash text primary key references public.storage_blobs (sha256) on delete cascade,
+    content      text not null,
+    content_tsv  tsvector generated always as (to_tsvector('simple', public.vn_unaccent(content))) stored,
+    extracted_at timestamptz not null default now()
+);
+
+alter table public.blob_contents enable row level security;
+
+create policy "blob contents readable by referencing users"
+    on public.blob_contents for select to authenticated
+    using (exists (
+        select 1 from public.documents d
+         where d.content_hash = blob_contents.content_hash and d.user_id = auth.uid()));
+
+create policy "blob contents writable by referencing users"
+    on public.blob_contents for insert to authenticated
+    with check (exists (
+        select 1 from public.documents d
+         where d.content_hash = blob_contents.content_hash and d.user_id = auth.uid()));
+
+create policy "blob contents updatable by referencing users"
+    on public.blob_contents for update to authenticated
+    using (exists (
+        select 1 from public.documents d
+         where d.content_hash = blob_contents.content_hash and d.user_id = auth.uid()));
+
+create index if not exists blob_contents_tsv_idx on public.blob_contents using gin (content_tsv);
+
+-- Ranked search inside file bodies, same row shape as search_documents.
+create or replace function public.search_document_contents(
+    p_user_id uuid,
+    p_query text,
+    p_limit integer default 50,
+    p_offset integer default 0
+)
+returns setof jsonb
+language sql
+stable
+security invoker
+as $$
+    with q as (select public.vn_prefix_tsquery(p_query) as query)
+    select to_jsonb(d)
+           || jsonb_build_object(
+                  'subjects', case when s.id is null then null else jsonb_build_object('name', s.name) end,
+                  'rank', ts_rank_cd(bc.content_tsv, q.query))
+      from public.documents d
+      cross join q
+      join public.blob_contents bc on bc.content_hash = d.content_hash
+      left join public.subjects s on s.id = d.subject_id
+     where d.user_id = p_user_id
+       and bc.content_tsv @@ q.query
+     order by ts_rank_cd(bc.content_tsv, q.query) desc, d.created_at desc, d.id desc
+     limit p_limit offset p_offset;
+$$;
+
+grant execute on function public.search_document_contents(uuid, text, integer, integer) to authenticated;
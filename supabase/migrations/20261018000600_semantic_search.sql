@@ -0,0 +1,94 @@
+-- Semantic search: extracted text is split into chunks, each chunk is
+-- embedded once per model (keyed by the chunk's SHA-256) and indexed
+-- with HNSW for cosine distance.
+create extension if not exists vector with schema extensions;
+
+create table if not exists public.blob_chunks (
+    content_hash text not null references public.storage_blobs (sha256) on delete cascade,
+    chunk_index  integer not null,
+    chunk_hash   text not null,
+    content      text not null,
+    primary key (content_hash, chunk_index)
+);
+
+create index if not exists blob_chunks_chunk_hash_idx on public.blob_chunks (chunk_hash);
+
+create table if not exists public.chunk_embeddings (
+    chunk_hash text not null,
+    model      text not null,
+    embedding  extensions.vector(1024) not null,
+    created_at timestamptz not null default now(),
+    primary key (chunk_hash, model)
+);
+
+create index if not exists chunk_embeddings_hnsw_idx
+    on public.chunk_embeddings using hnsw (embedding extensions.vector_cosine_ops)
+    with (m = 16, ef_construction = 64);
+
+alter table public.blob_chunks enable row level security;
+alter table public.chunk_embeddings enable row level security;
+
+create policy "blob chunks owned via documents"
+    on public.blob_chunks for all to authenticated
+    using (exists (
+        select 1 from public.documents d
+         where d.content_hash = blob_chunks.content_hash and d.user_id = auth.uid()))
+    with check (exists (
+        select 1 from public.documents d
+         where d.content_hash = blob_chunks.content_hash and d.user_id = auth.uid()));
+
+-- Embeddings are keyed by content hash only; reading them directly reveals
+-- nothing without the chunk text, and matching goes through the RPC below.
+create policy "chunk embeddings readable" on public.chunk_embeddings
+    for select to authenticated using (true);
+create policy "chunk embeddings insertable" on public.chunk_embeddings
+    for insert to authenticated with check (true);
+create policy "chunk embeddings updatable" on public.chunk_embeddings
+    for update to authenticated using (true);
+
+-- Nearest chunks for the caller's documents, best chunk per document.
+-- The HNSW scan fetches a candidate pool first, then restricts to the
+-- user's documents.
+create or replace function public.match_document_chunks(
+    p_user_id uuid,
+    p_query_embedding extensions.vector(1024),
+    p_model text,
+    p_limit integer default 20,
+    p_candidates integer default 400
+)
+returns setof jsonb
+language sql
+stable
+security definer
+set search_path = public, extensions
+as $$
+    with nearest as (
+        select ce.chunk_hash, ce.embedding <=> p_query_embedding as distance
+          from public.chunk_embeddings ce
+         where ce.model = p_model
+         order by ce.embedding <=> p_query_embedding
+         limit p_candidates
+    ),
+    ranked as (
+        select distinct on (d.id)
+               d.id as document_id, bc.content as snippet, n.distance
+          from nearest n
+          join public.blob_chunks bc on bc.chunk_hash = n.chunk_hash
+          join public.documents d on d.content_hash = bc.content_hash
+         where d.user_id = p_user_id
+           and p_user_id = auth.uid()
+         order by d.id, n.distance
+    )
+    select to_jsonb(d)
+           || jsonb_build_object(
+                  'subjects', case when s.id is null then null else jsonb_build_object('name', s.name) end,
+                  'similarity', 1 - r.distance,
+                  'snippet', left(r.snippet, 300))
+      from ranked r
+      join public.documents d on d.id = r.document_id
+      left join public.subjects s on s.id = d.subject_id
+     order by r.distance
+     limit p_limit;
+$$;
+
+grant execute on function public.match_document_chunks(uuid, extensions.vector, text, integer, integer) to authenticated;
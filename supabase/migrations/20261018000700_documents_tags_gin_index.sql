@@ -0,0 +1,5 @@
+-- Tag filtering in the library: utils.db.get_user_documents_page sends
+-- "has all selected tags" as `tags=cs.{...}` (tags @> array[...]), which a
+-- GIN index on the array answers without scanning the user's documents.
+create index if not exists documents_tags_gin_idx
+    on public.documents using gin (tags);
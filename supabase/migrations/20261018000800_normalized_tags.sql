@@ -0,0 +1,137 @@
+-- Normalized tags: one row per (user, tag) with a maintained document count,
+-- plus a document_tags link table. documents.tags stays the source of truth
+-- (the app writes it); triggers keep the normalized tables in sync so tag
+-- options, autocomplete and the tag cloud read only the small tags table.
+create table if not exists public.tags (
+    id             bigint generated always as identity primary key,
+    user_id        uuid not null,
+    name           text not null,
+    name_folded    text generated always as (public.vn_unaccent(name)) stored,
+    document_count integer not null default 0,
+    unique (user_id, name)
+);
+
+create table if not exists public.document_tags (
+    document_id bigint not null references public.documents (id) on delete cascade,
+    tag_id      bigint not null references public.tags (id) on delete cascade,
+    user_id     uuid not null,
+    primary key (document_id, tag_id)
+);
+
+alter table public.tags enable row level security;
+alter table public.document_tags enable row level security;
+
+create policy "tags owned by user"
+    on public.tags for select to authenticated
+    using (user_id = auth.uid());
+
+create policy "document_tags owned by user"
+    on public.document_tags for select to authenticated
+    using (user_id = auth.uid());
+
+-- Autocomplete: prefix match on the accent-folded name.
+create index if not exists tags_user_name_folded_idx
+    on public.tags (user_id, name_folded text_pattern_ops);
+-- Tag cloud: most used first.
+create index if not exists tags_user_count_idx
+    on public.tags (user_id, document_count desc);
+create index if not exists document_tags_tag_idx
+    on public.document_tags (tag_id);
+
+-- Counts follow document_tags, so deletes cascading from documents are counted too.
+create or replace function public.document_tags_count_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op = 'INSERT' then
+        update public.tags set document_count = document_count + 1 where id = new.tag_id;
+    else
+        update public.tags set document_count = document_count - 1 where id = old.tag_id;
+        delete from public.tags where id = old.tag_id and document_count <= 0;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists document_tags_count on public.document_tags;
+create trigger document_tags_count
+    after insert or delete on public.document_tags
+    for each row execute function public.document_tags_count_trigger();
+
+-- Mirror documents.tags into tags/document_tags.
+create or replace function public.documents_sync_tags_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_names text[];
+begin
+    v_names := array(
+        select distinct btrim(t)
+          from unnest(coalesce(new.tags, '{}'::text[])) as t
+         where btrim(t) <> '');
+
+    insert into public.tags (user_id, name)
+    select new.user_id, n from unnest(v_names) as n
+    on conflict (user_id, name) do nothing;
+
+    delete from public.document_tags dt
+     using public.tags t
+     where dt.document_id = new.id
+       and t.id = dt.tag_id
+       and not (t.name = any (v_names));
+
+    insert into public.document_tags (document_id, tag_id, user_id)
+    select new.id, t.id, new.user_id
+      from public.tags t
+     where t.user_id = new.user_id
+       and t.name = any (v_names)
+    on conflict do nothing;
+    return null;
+end;
+$$;
+
+drop trigger if exists documents_sync_tags on public.documents;
+create trigger documents_sync_tags
+    after insert or update of tags on public.documents
+    for each row execute function public.documents_sync_tags_trigger();
+
+-- Backfill from the existing arrays (counts are maintained by the trigger above).
+insert into public.tags (user_id, name)
+select distinct d.user_id, btrim(t)
+  from public.documents d, unnest(d.tags) as t
+ where btrim(t) <> ''
+on conflict (user_id, name) do nothing;
+
+insert into public.document_tags (document_id, tag_id, user_id)
+select distinct d.id, tg.id, d.user_id
+  from public.documents d
+ cross join lateral unnest(d.tags) as t
+  join public.tags tg on tg.user_id = d.user_id and tg.name = btrim(t)
+on conflict do nothing;
+
+-- Dashboard: count tags from the normalized table instead of unnesting every document.
+create or replace function public.get_user_statistics(p_user_id uuid)
+returns table (
+    total_documents bigint,
+    total_subjects bigint,
+    total_tags bigint,
+    total_size_bytes bigint
+)
+language sql
+stable
+security invoker
+as $$
+    select
+        (select count(*) from public.documents d where d.user_id = p_user_id),
+        (select count(*) from public.subjects s where s.user_id = p_user_id),
+        (select count(*) from public.tags t where t.user_id = p_user_id),
+        (select coalesce(sum(d.file_size), 0)::bigint
+           from public.documents d
+          where d.user_id = p_user_id);
+$$;
@@ -0,0 +1,25 @@
+-- Per-subject document count and total size for the subject views, grouped
+-- server-side so they do not download every document row. Unclassified
+-- documents come back with a null subject_id.
+create index if not exists documents_user_subject_idx
+    on public.documents (user_id, subject_id);
+
+create or replace function public.get_subject_document_counts(p_user_id uuid)
+returns table (
+    subject_id bigint,
+    document_count bigint,
+    total_size_bytes bigint
+)
+language sql
+stable
+security invoker
+as $$
+    select d.subject_id::bigint,
+           count(*),
+           coalesce(sum(d.file_size), 0)::bigint
+      from public.documents d
+     where d.user_id = p_user_id
+     group by d.subject_id;
+$$;
+
+grant execute on function public.get_subject_document_counts(uuid) to authenticated;
@@ -0,0 +1,24 @@
+-- updated_at on documents and subjects: UIManager memoizes rendered cards by
+-- (id, updated_at), so every update must bump it.
+alter table public.documents add column if not exists updated_at timestamptz not null default now();
+alter table public.subjects add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists documents_set_updated_at on public.documents;
+create trigger documents_set_updated_at
+    before update on public.documents
+    for each row execute function public.set_updated_at();
+
+drop trigger if exists subjects_set_updated_at on public.subjects;
+create trigger subjects_set_updated_at
+    before update on public.subjects
+    for each row execute function public.set_updated_at();
@@ -0,0 +1,282 @@
+-- Hardens content-addressed storage (20261018000300):
+--   * blobs start 'pending' and are only shared once 'ready'. The app
+--     server hashes the bytes it uploads itself and writes cas/ objects
+--     with the service role, so a ready blob always matches its hash;
+--   * authenticated users can no longer write under cas/ nor take
+--     references through RPCs. The server grants a one-shot claim to the
+--     user who uploaded the bytes, and a documents row can only point at
+--     a blob by consuming such a claim: content_hash / file_path of CAS
+--     documents are set here, not by the client;
+--   * reference counts follow documents rows through triggers, and blobs
+--     left without references are purged by the service role.
+alter table public.storage_blobs
+    add column if not exists status text not null default 'pending'
+        check (status in ('pending', 'ready', 'deleting')),
+    add column if not exists updated_at timestamptz not null default now();
+
+-- Blobs stored before this migration were uploaded by clients and cannot
+-- be re-hashed from SQL; they stay shared and counts are rebuilt from rows.
+update public.storage_blobs b
+   set status = 'ready',
+       ref_count = (select count(*) from public.documents d where d.content_hash = b.sha256);
+
+drop function if exists public.acquire_blob(text, text, bigint);
+drop function if exists public.release_blob(text);
+
+-- Right for one user to attach one document to a ready blob.
+create table if not exists public.blob_claims (
+    id         bigint generated always as identity primary key,
+    user_id    uuid not null references auth.users (id) on delete cascade,
+    sha256     text not null references public.storage_blobs (sha256) on delete cascade,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists blob_claims_user_sha256_idx on public.blob_claims (user_id, sha256);
+create index if not exists blob_claims_sha256_idx on public.blob_claims (sha256);
+
+alter table public.blob_claims enable row level security;
+
+-- Claims younger than this keep a blob with no documents from being purged
+-- (the document insert that will consume them may still be in flight).
+create or replace function public.blob_claim_grace()
+returns interval
+language sql
+immutable
+as $$ select interval '1 hour' $$;
+
+-- --- Service-role API (called by the app server only) ---
+
+-- Register a blob before upload. A 'pending' result means the caller must
+-- upload the bytes and call mark_blob_ready; 'ready' means they are already
+-- stored; 'deleting' means a purge is in progress and the caller retries.
+-- A purge stuck in 'deleting' for 10 minutes is taken over as a new upload.
+create or replace function public.reserve_blob(p_sha256 text, p_file_path text, p_file_size bigint)
+returns table (file_path text, status text)
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    return query
+    insert into public.storage_blobs as b (sha256, file_path, file_size)
+    values (p_sha256, p_file_path, p_file_size)
+    on conflict (sha256) do update
+        set status = case
+                         when b.status = 'deleting' and b.updated_at < now() - interval '10 minutes' then 'pending'
+                         else b.status
+                     end,
+            updated_at = case
+                             when b.status = 'deleting' and b.updated_at < now() - interval '10 minutes' then now()
+                             else b.updated_at
+                         end
+    returning b.file_path, b.status;
+end;
+$$;
+
+create or replace function public.mark_blob_ready(p_sha256 text)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update public.storage_blobs
+       set status = 'ready', updated_at = now()
+     where sha256 = p_sha256 and status = 'pending';
+$$;
+
+-- False when the blob is not ready (e.g. a purge just started).
+create or replace function public.grant_blob_claim(p_user_id uuid, p_sha256 text)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    perform 1 from public.storage_blobs where sha256 = p_sha256 and status = 'ready' for update;
+    if not found then
+        return false;
+    end if;
+    insert into public.blob_claims (user_id, sha256) values (p_user_id, p_sha256);
+    return true;
+end;
+$$;
+
+create or replace function public.revoke_blob_claim(p_user_id uuid, p_sha256 text)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from public.blob_claims
+     where id = (select id from public.blob_claims
+                  where user_id = p_user_id and sha256 = p_sha256
+                  order by id
+                  limit 1);
+$$;
+
+-- Start purging a blob with no documents and no live claims. Returns the
+-- storage path to remove (then call finish_blob_purge), or null to keep it.
+create or replace function public.begin_blob_purge(p_sha256 text)
+returns text
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_blob public.storage_blobs%rowtype;
+begin
+    select * into v_blob from public.storage_blobs where sha256 = p_sha256 for update;
+    if not found
+       or v_blob.ref_count > 0
+       or v_blob.status = 'pending'
+       or exists (select 1 from public.blob_claims c
+                   where c.sha256 = p_sha256 and c.created_at > now() - public.blob_claim_grace()) then
+        return null;
+    end if;
+    update public.storage_blobs set status = 'deleting', updated_at = now() where sha256 = p_sha256;
+    return v_blob.file_path;
+end;
+$$;
+
+-- Cascades to blob_contents, blob_chunks and expired claims.
+create or replace function public.finish_blob_purge(p_sha256 text)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from public.storage_blobs where sha256 = p_sha256 and status = 'deleting';
+$$;
+
+revoke execute on function public.reserve_blob(text, text, bigint) from public, anon, authenticated;
+revoke execute on function public.mark_blob_ready(text) from public, anon, authenticated;
+revoke execute on function public.grant_blob_claim(uuid, text) from public, anon, authenticated;
+revoke execute on function public.revoke_blob_claim(uuid, text) from public, anon, authenticated;
+revoke execute on function public.begin_blob_purge(text) from public, anon, authenticated;
+revoke execute on function public.finish_blob_purge(text) from public, anon, authenticated;
+grant execute on function public.reserve_blob(text, text, bigint) to service_role;
+grant execute on function public.mark_blob_ready(text) to service_role;
+grant execute on function public.grant_blob_claim(uuid, text) to service_role;
+grant execute on function public.revoke_blob_claim(uuid, text) to service_role;
+grant execute on function public.begin_blob_purge(text) to service_role;
+grant execute on function public.finish_blob_purge(text) to service_role;
+
+-- --- documents <-> storage_blobs ---
+
+-- Inserting a CAS document consumes one of the caller's claims and takes a
+-- reference; file_path / file_size come from the blob. Clients cannot point
+-- a document at cas/ without a claim, nor change the blob of a document.
+create or replace function public.documents_bind_blob()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_claim bigint;
+    v_blob public.storage_blobs%rowtype;
+begin
+    if tg_op = 'UPDATE' then
+        if (new.content_hash is distinct from old.content_hash or new.file_path is distinct from old.file_path)
+           and coalesce(auth.role(), '') <> 'service_role' then
+            raise exception 'content_hash and file_path of a document cannot be changed'
+                using errcode = '42501';
+        end if;
+        return new;
+    end if;
+
+    if new.content_hash is null then
+        if new.file_path like 'cas/%' then
+            raise exception 'cas/ objects can only be attached through content_hash'
+                using errcode = '42501';
+        end if;
+        return new;
+    end if;
+
+    delete from public.blob_claims
+     where id = (select id from public.blob_claims
+                  where user_id = auth.uid() and sha256 = new.content_hash
+                  order by id
+                  limit 1
+                  for update skip locked)
+    returning id into v_claim;
+    if v_claim is null then
+        raise exception 'no upload claim for blob %', new.content_hash
+            using errcode = '42501';
+    end if;
+
+    update public.storage_blobs
+       set ref_count = ref_count + 1, updated_at = now()
+     where sha256 = new.content_hash and status = 'ready'
+    returning * into v_blob;
+    if not found then
+        raise exception 'blob % is not ready', new.content_hash
+            using errcode = '42501';
+    end if;
+
+    new.file_path := v_blob.file_path;
+    new.file_size := v_blob.file_size;
+    return new;
+end;
+$$;
+
+create or replace function public.documents_release_blob()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    update public.storage_blobs
+       set ref_count = greatest(ref_count - 1, 0), updated_at = now()
+     where sha256 = old.content_hash;
+    return old;
+end;
+$$;
+
+drop trigger if exists documents_bind_blob_trigger on public.documents;
+create trigger documents_bind_blob_trigger
+    before insert or update of content_hash, file_path on public.documents
+    for each row execute function public.documents_bind_blob();
+
+drop trigger if exists documents_release_blob_trigger on public.documents;
+create trigger documents_release_blob_trigger
+    after delete on public.documents
+    for each row when (old.content_hash is not null)
+    execute function public.documents_release_blob();
+
+-- --- Storage and blob_contents access ---
+
+-- Only the service role writes or deletes under cas/; reads go through
+-- the blob a user's document is bound to.
+drop policy if exists "cas blobs writable by authenticated users" on storage.objects;
+drop policy if exists "cas blobs readable by referencing users" on storage.objects;
+
+create policy "cas blobs readable by referencing users"
+    on storage.objects for select to authenticated
+    using (
+        bucket_id = 'document_files'
+        and (storage.foldername(name))[1] = 'cas'
+        and exists (
+            select 1 from public.documents d
+              join public.storage_blobs b on b.sha256 = d.content_hash
+             where b.file_path = storage.objects.name
+               and b.status = 'ready'
+               and d.user_id = auth.uid()
+        )
+    );
+
+-- Extracted text is written by the server's extraction worker (service
+-- role); users read the contents of blobs their documents are bound to.
+drop policy if exists "blob contents writable by referencing users" on public.blob_contents;
+drop policy if exists "blob contents updatable by referencing users" on public.blob_contents;
+drop policy if exists "blob contents readable by referencing users" on public.blob_contents;
+
+create policy "blob contents readable by referencing users"
+    on public.blob_contents for select to authenticated
+    using (exists (
+        select 1 from public.documents d
+          join public.storage_blobs b on b.sha256 = d.content_hash
+         where d.content_hash = blob_contents.content_hash
+           and b.status = 'ready'
+           and d.user_id = auth.uid()));
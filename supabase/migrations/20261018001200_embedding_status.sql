@@ -0,0 +1,12 @@
+-- Embedding progress is tracked apart from extraction: a blob whose text
+-- is stored but whose embedding run failed (or used another model) is
+-- picked up again instead of being skipped as already extracted.
+-- Existing rows start unmarked; re-indexing them reuses the chunk
+-- embeddings already stored, so only missing chunks call the API.
+alter table public.blob_contents
+    add column if not exists embedding_model text,
+    add column if not exists embedded_at     timestamptz,
+    add column if not exists embedding_error text;
+
+create index if not exists blob_contents_embedding_model_idx
+    on public.blob_contents (embedding_model, extracted_at);
@@ -0,0 +1,103 @@
+-- Tightens semantic search (20261018000600):
+--   * chunk embeddings are shared between users, so they are no longer
+--     writable directly; upsert_chunk_embeddings only accepts chunks of a
+--     blob the caller has a document for (or the service role);
+--   * blob chunks are written by the extraction worker (service role) and
+--     only readable by users;
+--   * match_document_chunks filters to the caller's chunks inside the
+--     HNSW scan (pgvector >= 0.8 iterative scan), so other users' nearer
+--     chunks can no longer crowd the caller's out of the candidate pool.
+drop policy if exists "chunk embeddings insertable" on public.chunk_embeddings;
+drop policy if exists "chunk embeddings updatable" on public.chunk_embeddings;
+
+drop policy if exists "blob chunks owned via documents" on public.blob_chunks;
+create policy "blob chunks readable via documents"
+    on public.blob_chunks for select to authenticated
+    using (exists (
+        select 1 from public.documents d
+         where d.content_hash = blob_chunks.content_hash and d.user_id = auth.uid()));
+
+-- p_rows: [{"chunk_hash": ..., "embedding": "[...]"}]. Rows whose chunk is
+-- not part of p_content_hash are ignored. Returns the number stored.
+create or replace function public.upsert_chunk_embeddings(p_content_hash text, p_model text, p_rows jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public, extensions
+as $$
+declare
+    v_count integer;
+begin
+    if coalesce(auth.role(), '') <> 'service_role' and not exists (
+        select 1 from public.documents d
+         where d.content_hash = p_content_hash and d.user_id = auth.uid()
+    ) then
+        raise exception 'no document for blob %', p_content_hash using errcode = '42501';
+    end if;
+
+    insert into public.chunk_embeddings as ce (chunk_hash, model, embedding)
+    select r.chunk_hash, p_model, r.embedding::extensions.vector(1024)
+      from jsonb_to_recordset(p_rows) as r (chunk_hash text, embedding text)
+     where exists (select 1 from public.blob_chunks bc
+                    where bc.content_hash = p_content_hash and bc.chunk_hash = r.chunk_hash)
+    on conflict (chunk_hash, model) do update set embedding = excluded.embedding, created_at = now();
+
+    get diagnostics v_count = row_count;
+    return v_count;
+end;
+$$;
+
+revoke execute on function public.upsert_chunk_embeddings(text, text, jsonb) from public, anon;
+grant execute on function public.upsert_chunk_embeddings(text, text, jsonb) to authenticated, service_role;
+
+-- Nearest chunks for the caller's documents, best chunk per document.
+-- The ownership filter runs inside the ordered HNSW scan; with
+-- iterative_scan the index keeps producing neighbours until p_candidates
+-- of the caller's chunks are found (bounded by hnsw.max_scan_tuples).
+create or replace function public.match_document_chunks(
+    p_user_id uuid,
+    p_query_embedding extensions.vector(1024),
+    p_model text,
+    p_limit integer default 20,
+    p_candidates integer default 400
+)
+returns setof jsonb
+language sql
+stable
+security definer
+set search_path = public, extensions
+set hnsw.iterative_scan = relaxed_order
+set hnsw.ef_search = 100
+as $$
+    with nearest as materialized (
+        select ce.chunk_hash, ce.embedding <=> p_query_embedding as distance
+          from public.chunk_embeddings ce
+         where ce.model = p_model
+           and p_user_id = auth.uid()
+           and exists (
+               select 1 from public.blob_chunks bc
+                 join public.documents d on d.content_hash = bc.content_hash
+                where bc.chunk_hash = ce.chunk_hash and d.user_id = p_user_id)
+         order by ce.embedding <=> p_query_embedding
+         limit p_candidates
+    ),
+    ranked as (
+        select distinct on (d.id)
+               d.id as document_id, bc.content as snippet, n.distance
+          from nearest n
+          join public.blob_chunks bc on bc.chunk_hash = n.chunk_hash
+          join public.documents d on d.content_hash = bc.content_hash
+         where d.user_id = p_user_id
+         order by d.id, n.distance
+    )
+    select to_jsonb(d)
+           || jsonb_build_object(
+                  'subjects', case when s.id is null then null else jsonb_build_object('name', s.name) end,
+                  'similarity', 1 - r.distance,
+                  'snippet', left(r.snippet, 300))
+      from ranked r
+      join public.documents d on d.id = r.document_id
+      left join public.subjects s on s.id = d.subject_id
+     order by r.distance
+     limit p_limit;
+$$;
@@ -0,0 +1,56 @@
+-- reserve_blob tells the caller whether it created (or took over) the
+-- blob, so only that caller uploads the bytes; concurrent uploads of the
+-- same content wait for 'ready' instead of writing the same cas/ object.
+-- abandon_blob lets a failed creator hand the blob to the next caller.
+drop function if exists public.reserve_blob(text, text, bigint);
+
+create function public.reserve_blob(p_sha256 text, p_file_path text, p_file_size bigint)
+returns table (file_path text, status text, created boolean)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_blob public.storage_blobs%rowtype;
+begin
+    insert into public.storage_blobs (sha256, file_path, file_size)
+    values (p_sha256, p_file_path, p_file_size)
+    on conflict (sha256) do nothing
+    returning * into v_blob;
+    if found then
+        return query select v_blob.file_path, v_blob.status, true;
+        return;
+    end if;
+
+    select * into v_blob from public.storage_blobs b where b.sha256 = p_sha256 for update;
+    if not found then
+        -- Abandoned or purged meanwhile: the caller asks again
+        return query select p_file_path, 'missing'::text, false;
+        return;
+    end if;
+
+    -- An upload or purge stuck for 10 minutes is taken over as a new upload
+    if v_blob.status in ('pending', 'deleting') and v_blob.updated_at < now() - interval '10 minutes' then
+        update public.storage_blobs b set status = 'pending', updated_at = now() where b.sha256 = p_sha256;
+        return query select v_blob.file_path, 'pending'::text, true;
+        return;
+    end if;
+
+    return query select v_blob.file_path, v_blob.status, false;
+end;
+$$;
+
+create or replace function public.abandon_blob(p_sha256 text)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from public.storage_blobs
+     where sha256 = p_sha256 and status = 'pending' and ref_count = 0;
+$$;
+
+revoke execute on function public.reserve_blob(text, text, bigint) from public, anon, authenticated;
+revoke execute on function public.abandon_blob(text) from public, anon, authenticated;
+grant execute on function public.reserve_blob(text, text, bigint) to service_role;
+grant execute on function public.abandon_blob(text) to service_role;
@@ -0,0 +1,68 @@
+-- Tag ("has all selected tags", GIN on documents.tags) and subject filters
+-- run inside the ranked searches, so a keyword combined with filters is
+-- paged on the server instead of filtering whichever page was loaded.
+drop function if exists public.search_documents(uuid, text, integer, integer);
+drop function if exists public.search_document_contents(uuid, text, integer, integer);
+
+create or replace function public.search_documents(
+    p_user_id uuid,
+    p_query text,
+    p_limit integer default 50,
+    p_offset integer default 0,
+    p_tags text[] default null,
+    p_subject_id bigint default null
+)
+returns setof jsonb
+language sql
+stable
+security invoker
+as $$
+    with q as (select public.vn_prefix_tsquery(p_query) as query)
+    select to_jsonb(d)
+           || jsonb_build_object(
+                  'subjects', case when s.id is null then null else jsonb_build_object('name', s.name) end,
+                  'rank', ts_rank_cd(ds.search_vector, q.query))
+      from public.document_search ds
+      cross join q
+      join public.documents d on d.id = ds.document_id
+      left join public.subjects s on s.id = d.subject_id
+     where ds.user_id = p_user_id
+       and ds.search_vector @@ q.query
+       and (p_tags is null or d.tags @> p_tags)
+       and (p_subject_id is null or d.subject_id = p_subject_id)
+     order by ts_rank_cd(ds.search_vector, q.query) desc, d.created_at desc, d.id desc
+     limit p_limit offset p_offset;
+$$;
+
+create or replace function public.search_document_contents(
+    p_user_id uuid,
+    p_query text,
+    p_limit integer default 50,
+    p_offset integer default 0,
+    p_tags text[] default null,
+    p_subject_id bigint default null
+)
+returns setof jsonb
+language sql
+stable
+security invoker
+as $$
+    with q as (select public.vn_prefix_tsquery(p_query) as query)
+    select to_jsonb(d)
+           || jsonb_build_object(
+                  'subjects', case when s.id is null then null else jsonb_build_object('name', s.name) end,
+                  'rank', ts_rank_cd(bc.content_tsv, q.query))
+      from public.documents d
+      cross join q
+      join public.blob_contents bc on bc.content_hash = d.content_hash
+      left join public.subjects s on s.id = d.subject_id
+     where d.user_id = p_user_id
+       and bc.content_tsv @@ q.query
+       and (p_tags is null or d.tags @> p_tags)
+       and (p_subject_id is null or d.subject_id = p_subject_id)
+     order by ts_rank_cd(bc.content_tsv, q.query) desc, d.created_at desc, d.id desc
+     limit p_limit offset p_offset;
+$$;
+
+grant execute on function public.search_documents(uuid, text, integer, integer, text[], bigint) to authenticated;
+grant execute on function public.search_document_contents(uuid, text, integer, integer, text[], bigint) to authenticated;
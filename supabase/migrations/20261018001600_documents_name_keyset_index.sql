@@ -0,0 +1,5 @@
+-- Keyset pagination sorted by name: (user_id, file_name, id) matches the
+-- ORDER BY of utils.db.get_user_documents_page(order_by="file_name")
+-- in both directions.
+create index if not exists documents_user_file_name_id_idx
+    on public.documents (user_id, file_name, id);
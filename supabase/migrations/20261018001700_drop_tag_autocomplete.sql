@@ -0,0 +1,5 @@
+-- The tag autocomplete API was dropped (tag inputs live in forms that do
+-- not rerun while typing), so the accent-folded name and its prefix index
+-- are no longer read; stop maintaining them on every tag insert.
+drop index if exists public.tags_user_name_folded_idx;
+alter table public.tags drop column if exists name_folded;
@@ -1,72 +1,658 @@
 # utils/db.py
 import streamlit as st
+import base64
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin
+import httpx
 from supabase import create_client, Client
-from typing import List, Dict, Any
+from supabase.lib.client_options import SyncClientOptions
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from typing import List, Dict, Any, Optional, Callable
+
+# Giới hạn kết nối của transport HTTP dùng chung cho mọi session
+HTTP_POOL_MAX_CONNECTIONS = 50
+HTTP_POOL_MAX_KEEPALIVE = 20
+HTTP_KEEPALIVE_EXPIRY = 30.0
+
+# Khóa trong session_state chứa client Supabase đã đăng nhập của session
+SESSION_CLIENT_KEY = "supabase_client"
 
 @st.cache_resource
-def init_connection() -> Client:
-    """Khởi tạo và trả về client Supabase."""
+def get_http_pool() -> httpx.Client:
+    """Transport HTTP dùng chung (keep-alive, HTTP/2 nếu có gói h2, số kết nối giới hạn)."""
+    limits = httpx.Limits(
+        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(60.0, connect=10.0)
+    try:
+        return httpx.Client(http2=True, limits=limits, timeout=timeout)
+    except ImportError:
+        # Thiếu gói h2: vẫn dùng chung pool keep-alive qua HTTP/1.1
+        return httpx.Client(limits=limits, timeout=timeout)
+
+def create_session_client() -> Client:
+    """Tạo client Supabase riêng cho một session (trạng thái đăng nhập riêng) nhưng dùng chung transport HTTP."""
     url = st.secrets["SUPABASE_URL"]
     key = st.secrets["SUPABASE_KEY"]
-    return create_client(url, key)
+    # Token refresh is driven by core.auth's background TokenRefresher, not a timer per client
+    options = SyncClientOptions(httpx_client=get_http_pool(), auto_refresh_token=False)
+    return create_client(url, key, options=options)
+
+@st.cache_resource
+def init_connection() -> Client:
+    """Khởi tạo và trả về client Supabase dùng chung (chưa đăng nhập)."""
+    return create_session_client()
 
 supabase: Client = init_connection()
 
+@st.cache_resource
+def get_service_client() -> Client | None:
+    """Client dùng service role key (SUPABASE_SERVICE_ROLE_KEY, bỏ qua RLS); None nếu chưa cấu hình.
+
+    Chỉ chạy phía server, cho các thao tác server tự kiểm chứng: ghi blob vào cas/, cấp claim, dọn blob, lưu nội dung trích xuất.
+    """
+    key = st.secrets.get("SUPABASE_SERVICE_ROLE_KEY", "")
+    if not key:
+        return None
+    options = SyncClientOptions(httpx_client=get_http_pool(), auto_refresh_token=False, persist_session=False)
+    return create_client(st.secrets["SUPABASE_URL"], key, options=options)
+
+def bind_session_client(client: Client | None) -> None:
+    """Gắn (hoặc gỡ) client đã đăng nhập vào session hiện tại."""
+    if client is None:
+        st.session_state.pop(SESSION_CLIENT_KEY, None)
+    else:
+        st.session_state[SESSION_CLIENT_KEY] = client
+
+def get_client() -> Client:
+    """Client của session hiện tại nếu đã đăng nhập, ngược lại là client dùng chung."""
+    if get_script_run_ctx() is not None:
+        client = st.session_state.get(SESSION_CLIENT_KEY)
+        if client is not None:
+            return client
+    return supabase
+
+# Số tài liệu mỗi trang khi phân trang bằng keyset cursor (mặc định, ghi đè bằng secret DOCUMENTS_PAGE_SIZE)
+DOCUMENTS_PAGE_SIZE = 50
+
+def documents_page_size() -> int:
+    """Kích thước trang đã cấu hình; cùng secret với Config.documents_page_size để các trang gọi thẳng utils.db cũng dùng."""
+    return int(st.secrets.get("DOCUMENTS_PAGE_SIZE", DOCUMENTS_PAGE_SIZE))
+
+# Các cột mà danh sách "tài liệu gần đây" thực sự hiển thị
+RECENT_DOCUMENT_COLUMNS = "id, file_name, tags, created_at, updated_at, subjects(name)"
+
+# --- THÔNG BÁO THAY ĐỔI DỮ LIỆU ---
+
+# listener(table, user_id) được gọi sau mỗi lần ghi; user_id = None nghĩa là không xác định được
+_change_listeners: List[Callable[[str, Optional[str]], None]] = []
+
+def register_change_listener(listener: Callable[[str, Optional[str]], None]) -> None:
+    """Đăng ký hàm nhận thông báo khi dữ liệu của một bảng thay đổi (dùng để xóa cache)."""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+def _notify_change(table: str, rows: Any = None, user_id: Optional[str] = None) -> None:
+    """Báo cho các listener biết user nào vừa bị thay đổi dữ liệu."""
+    user_ids = {user_id} if user_id else {r.get("user_id") for r in (rows or []) if isinstance(r, dict)}
+    for uid in user_ids or {None}:
+        for listener in _change_listeners:
+            listener(table, uid)
+
 # --- CÁC HÀM LIÊN QUAN ĐẾN TÀI LIỆU (DOCUMENTS) ---
 
 def get_user_documents(user_id: str) -> List[Dict[str, Any]]:
     """Lấy tất cả tài liệu của một user, sắp xếp theo ngày tạo mới nhất."""
-    res = supabase.table("documents").select("*, subjects(name)").eq("user_id", user_id).order("created_at", desc=True).execute()
+    res = get_client().table("documents").select("*, subjects(name)").eq("user_id", user_id).order("created_at", desc=True).execute()
     return res.data
 
+def _pg_quote(value: Any) -> str:
+    """Giá trị trong filter PostgREST, đặt trong dấu nháy kép để dấu phẩy/ngoặc không làm vỡ filter."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _pg_array_literal(values: List[str]) -> str:
+    """Mảng text của Postgres ({"a","b"}), quote từng phần tử để tag chứa dấu phẩy/ngoặc không làm vỡ filter."""
+    return "{" + ",".join(_pg_quote(v) for v in values) + "}"
+
+# Các cột được phép dùng làm khóa sắp xếp của keyset cursor (luôn kèm id để thứ tự là duy nhất)
+DOCUMENT_SORT_COLUMNS = ("created_at", "file_name")
+
+def get_user_documents_page(
+    user_id: str,
+    cursor: Optional[Dict[str, Any]] = None,
+    page_size: Optional[int] = None,
+    ascending: bool = False,
+    tags: Optional[List[str]] = None,
+    subject_id: Optional[int] = None,
+    order_by: str = "created_at",
+) -> Dict[str, Any]:
+    """Lấy một trang tài liệu theo keyset cursor (order_by, id); order_by là created_at hoặc file_name.
+
+    Các bộ lọc được đẩy xuống server: `tags` (phải có đủ mọi tag, toán tử mảng `cs`
+    dùng GIN index trên documents.tags) và `subject_id`; từ khóa đi qua search_documents.
+    Trả về {"data": [...], "next_cursor": {...} | None}; truyền next_cursor vào lần gọi sau để lấy trang kế tiếp.
+    """
+    page_size = page_size or documents_page_size()
+    query = get_client().table("documents").select("*, subjects(name)").eq("user_id", user_id)
+    if tags:
+        query = query.filter("tags", "cs", _pg_array_literal(tags))
+    if subject_id is not None:
+        query = query.eq("subject_id", subject_id)
+    if order_by not in DOCUMENT_SORT_COLUMNS:
+        raise ValueError(f"Không sắp xếp được theo cột {order_by}")
+    if cursor:
+        op = "gt" if ascending else "lt"
+        value = _pg_quote(cursor[order_by])
+        query = query.or_(
+            f'{order_by}.{op}.{value},'
+            f'and({order_by}.eq.{value},id.{op}.{cursor["id"]})'
+        )
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    res = (
+        query.order(order_by, desc=not ascending)
+        .order("id", desc=not ascending)
+        .limit(page_size + 1)
+        .execute()
+    )
+    rows = res.data or []
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = {order_by: last[order_by], "id": last["id"]}
+    return {"data": rows, "next_cursor": next_cursor}
+
+def get_recent_documents(user_id: str, limit: int = 5, columns: str = RECENT_DOCUMENT_COLUMNS) -> List[Dict[str, Any]]:
+    """Lấy `limit` tài liệu mới nhất của user, chỉ chọn các cột cần hiển thị."""
+    res = (
+        get_client().table("documents")
+        .select(columns)
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return res.data or []
+
+def _search_page(
+    rpc_name: str,
+    user_id: str,
+    query: str,
+    cursor: Optional[Dict[str, Any]],
+    page_size: Optional[int],
+    tags: Optional[List[str]] = None,
+    subject_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Gọi RPC tìm kiếm và trả về một trang theo offset (lấy dư 1 dòng để biết còn trang sau).
+
+    `tags` (phải có đủ mọi tag) và `subject_id` được lọc trong RPC, trước khi phân trang.
+    """
+    page_size = page_size or documents_page_size()
+    offset = (cursor or {}).get("offset", 0)
+    res = get_client().rpc(rpc_name, {
+        "p_user_id": user_id,
+        "p_query": query,
+        "p_limit": page_size + 1,
+        "p_offset": offset,
+        "p_tags": list(tags) if tags else None,
+        "p_subject_id": subject_id,
+    }).execute()
+    rows = res.data or []
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = {"offset": offset + page_size}
+    return {"data": rows, "next_cursor": next_cursor}
+
+def search_documents(
+    user_id: str,
+    query: str,
+    cursor: Optional[Dict[str, Any]] = None,
+    page_size: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    subject_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Tìm kiếm toàn văn (tên file, tags, môn học; không phân biệt dấu tiếng Việt), trả về một trang kết quả theo độ liên quan.
+
+    Cùng định dạng với get_user_documents_page: {"data": [...], "next_cursor": {"offset": n} | None}.
+    """
+    return _search_page("search_documents", user_id, query, cursor, page_size, tags, subject_id)
+
+def search_document_contents(
+    user_id: str,
+    query: str,
+    cursor: Optional[Dict[str, Any]] = None,
+    page_size: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    subject_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Tìm kiếm trong nội dung file (văn bản đã trích xuất), cùng định dạng trang với search_documents."""
+    return _search_page("search_document_contents", user_id, query, cursor, page_size, tags, subject_id)
+
+def count_user_documents(user_id: str) -> int:
+    """Đếm số tài liệu của user mà không tải dữ liệu về."""
+    res = get_client().table("documents").select("id", count="exact", head=True).eq("user_id", user_id).execute()
+    return res.count or 0
+
+def get_user_statistics(user_id: str) -> Dict[str, Any] | None:
+    """Lấy số liệu thống kê (số tài liệu, môn học, tags, tổng dung lượng) tính sẵn trong database."""
+    res = get_client().rpc("get_user_statistics", {"p_user_id": user_id}).execute()
+    rows = res.data
+    if isinstance(rows, list):
+        return rows[0] if rows else None
+    return rows
+
+def get_subject_document_counts(user_id: str) -> Dict[Optional[int], Dict[str, int]]:
+    """Số tài liệu và tổng dung lượng theo môn học, gom nhóm trong database.
+
+    Trả về {subject_id: {"document_count": n, "total_size_bytes": b}}; tài liệu chưa phân loại nằm ở khóa None.
+    """
+    res = get_client().rpc("get_subject_document_counts", {"p_user_id": user_id}).execute()
+    return {
+        row["subject_id"]: {
+            "document_count": int(row.get("document_count") or 0),
+            "total_size_bytes": int(row.get("total_size_bytes") or 0),
+        }
+        for row in res.data or []
+    }
+
+# --- TAGS (bảng tags chuẩn hóa, số tài liệu được trigger cập nhật sẵn) ---
+
+def get_tag_cloud(user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Các tag của user kèm số tài liệu ({"name", "document_count"}), dùng nhiều nhất trước."""
+    query = (
+        get_client().table("tags")
+        .select("name, document_count")
+        .eq("user_id", user_id)
+        .order("document_count", desc=True)
+        .order("name")
+    )
+    if limit:
+        query = query.limit(limit)
+    return query.execute().data or []
+
 def insert_document(metadata: Dict[str, Any]) -> None:
     """Chèn thông tin tài liệu vào database."""
-    supabase.table("documents").insert(metadata).execute()
+    get_client().table("documents").insert(metadata).execute()
+    _notify_change("documents", user_id=metadata.get("user_id"))
+
+def insert_documents(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Chèn nhiều tài liệu bằng một lệnh insert duy nhất."""
+    if not rows:
+        return []
+    res = get_client().table("documents").insert(rows).execute()
+    for user_id in {r.get("user_id") for r in rows}:
+        _notify_change("documents", user_id=user_id)
+    return res.data or []
 
 def delete_document(doc_id: str, file_path: str) -> None:
-    """Xóa tài liệu khỏi Storage và Database."""
-    supabase.storage.from_("document_files").remove([file_path])
-    supabase.table("documents").delete().eq("id", doc_id).execute()
+    """Xóa tài liệu khỏi Database; file trên Storage chỉ bị xóa khi không còn tài liệu nào tham chiếu."""
+    res = get_client().table("documents").delete().eq("id", doc_id).execute()
+    content_hash = (res.data or [{}])[0].get("content_hash")
+    if content_hash:
+        # Trigger đã trừ tham chiếu; blob chỉ bị dọn khi không còn tài liệu / claim nào
+        purge_blob(content_hash)
+    else:
+        remove_unreferenced_file(file_path)
+    forget_signed_urls([file_path])
+    _notify_change("documents", res.data)
     
+def remove_unreferenced_file(file_path: str) -> bool:
+    """Xóa file riêng (không theo content hash) khỏi Storage nếu không còn dòng documents nào trỏ tới nó.
+
+    Tài liệu cũ có thể dùng chung đường dẫn (ví dụ {user_id}/{tên file}), nên không xóa mù theo file_path.
+    """
+    others = get_client().table("documents").select("id").eq("file_path", file_path).limit(1).execute()
+    if others.data:
+        return False
+    get_client().storage.from_("document_files").remove([file_path])
+    return True
+
 def get_document_by_id(doc_id: str) -> Dict[str, Any]:
     """Lấy thông tin một tài liệu cụ thể bằng ID."""
-    res = supabase.table("documents").select("*, subjects(name)").eq("id", doc_id).single().execute()
+    res = get_client().table("documents").select("*, subjects(name)").eq("id", doc_id).single().execute()
     return res.data
 
 def update_document_metadata(doc_id: str, updates: Dict[str, Any]) -> None:
     """Cập nhật thông tin của một tài liệu."""
-    supabase.table("documents").update(updates).eq("id", doc_id).execute()
+    res = get_client().table("documents").update(updates).eq("id", doc_id).execute()
+    _notify_change("documents", res.data)
     
-def upload_file_to_storage(file_bytes, file_path: str):
-    """Tải file lên Supabase Storage, nếu tồn tại thì cập nhật."""
+def upload_file_to_storage(file_bytes, file_path: str, content_type: str | None = None, on_progress=None):
+    """Tải file lên Supabase Storage, nếu tồn tại thì cập nhật.
+
+    Nếu truyền vào một file-like object (ví dụ UploadedFile) thì file được gửi theo từng chunk qua giao thức resumable.
+    """
+    if not isinstance(file_bytes, (bytes, bytearray)):
+        upload_file_resumable(file_bytes, file_path, content_type=content_type, on_progress=on_progress)
+        return
     try:
-        supabase.storage.from_("document_files").upload(path=file_path, file=file_bytes)
+        get_client().storage.from_("document_files").upload(path=file_path, file=file_bytes)
     except Exception as e:
         if "Duplicate" in str(e):
-            supabase.storage.from_("document_files").update(path=file_path, file=file_bytes)
+            get_client().storage.from_("document_files").update(path=file_path, file=file_bytes)
         else:
             raise e
 
+# --- UPLOAD THEO CHUNK (GIAO THỨC TUS / RESUMABLE) ---
+
+# Supabase yêu cầu mọi chunk (trừ chunk cuối) đúng 6MB
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+UPLOAD_MAX_RETRIES = 3
+TUS_VERSION = "1.0.0"
+
+def _access_token() -> str:
+    """Token của người dùng đang đăng nhập, để Storage áp dụng RLS theo đúng user.
+
+    Không dùng API key (anon) làm bearer: upload khi chưa có session phải thất bại thay vì bỏ qua session.
+    """
+    session = get_client().auth.get_session()
+    if not session or not session.access_token:
+        raise RuntimeError("Cần đăng nhập để upload file")
+    return session.access_token
+
+def _tus_headers(extra: Dict[str, str] | None = None, service: bool = False) -> Dict[str, str]:
+    if service:
+        key = token = st.secrets["SUPABASE_SERVICE_ROLE_KEY"]
+    else:
+        key, token = st.secrets["SUPABASE_KEY"], _access_token()
+    headers = {"authorization": f"Bearer {token}", "apikey": key, "tus-resumable": TUS_VERSION}
+    headers.update(extra or {})
+    return headers
+
+def _tus_metadata(**fields: str) -> str:
+    return ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in fields.items())
+
+def _tus_offset(http: httpx.Client, upload_url: str, service: bool = False) -> int | None:
+    """Offset server đã nhận (HEAD); None nếu chính lần hỏi này cũng lỗi."""
+    try:
+        head = http.head(upload_url, headers=_tus_headers(service=service))
+        head.raise_for_status()
+        return int(head.headers["upload-offset"])
+    except (httpx.HTTPError, KeyError, ValueError):
+        return None
+
+def _file_size(fileobj) -> int:
+    size = getattr(fileobj, "size", None)
+    if size is None:
+        pos = fileobj.tell()
+        size = fileobj.seek(0, 2)
+        fileobj.seek(pos)
+    return int(size)
+
+def upload_file_resumable(
+    fileobj,
+    file_path: str,
+    content_type: str | None = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    max_retries: int = UPLOAD_MAX_RETRIES,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    service: bool = False,
+) -> None:
+    """Tải file lên Storage theo từng chunk (TUS): mỗi request nhỏ và chỉ chunk lỗi phải gửi lại.
+
+    Chunk lỗi được gửi lại sau khi hỏi server offset hiện tại (HEAD); nếu HEAD cũng lỗi thì gửi lại từ offset cũ
+    và tính vào số lần thử. on_progress(sent, total) được gọi sau mỗi chunk.
+    Lưu ý: UploadedFile của Streamlit đã nằm sẵn trong bộ nhớ, nên chia chunk không giảm bộ nhớ đỉnh
+    (chỉ file-like đọc từ đĩa mới được đọc từng chunk).
+    service=True gửi bằng service role key (chỉ dùng cho blob trong cas/).
+    """
+    total = _file_size(fileobj)
+    endpoint = st.secrets["SUPABASE_URL"].rstrip("/") + "/storage/v1/upload/resumable"
+    http = get_http_pool()
+    res = http.post(endpoint, headers=_tus_headers({
+        "upload-length": str(total),
+        "upload-metadata": _tus_metadata(
+            bucketName="document_files",
+            objectName=file_path,
+            contentType=content_type or "application/octet-stream",
+            cacheControl="3600",
+        ),
+        "x-upsert": "true",
+    }, service=service))
+    res.raise_for_status()
+    upload_url = urljoin(endpoint, res.headers["location"])
+
+    offset = 0
+    retries = 0
+    fileobj.seek(0)
+    while offset < total:
+        chunk = fileobj.read(chunk_size)
+        try:
+            res = http.patch(upload_url, content=chunk, headers=_tus_headers({
+                "upload-offset": str(offset),
+                "content-type": "application/offset+octet-stream",
+            }, service=service))
+            res.raise_for_status()
+            offset = int(res.headers.get("upload-offset", offset + len(chunk)))
+            retries = 0
+        except httpx.HTTPError:
+            retries += 1
+            if retries > max_retries:
+                raise
+            time.sleep(min(2 ** retries, 10))
+            # Hỏi server đã nhận đến đâu rồi gửi tiếp từ đó (không hỏi được thì thử lại từ offset cũ)
+            server_offset = _tus_offset(http, upload_url, service=service)
+            if server_offset is not None:
+                offset = server_offset
+        fileobj.seek(offset)
+        if on_progress:
+            on_progress(offset, total)
+
+# --- LƯU TRỮ THEO NỘI DUNG (CONTENT-ADDRESSED, KHỬ TRÙNG LẶP) ---
+
+def hash_file(fileobj, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """Tính SHA-256 của file bằng cách đọc từng chunk (không nạp cả file vào bộ nhớ)."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+def content_addressed_path(sha256: str) -> str:
+    """Đường dẫn Storage của blob theo mã băm nội dung."""
+    return f"cas/{sha256[:2]}/{sha256}"
+
+# Upload khác cùng nội dung đang ghi blob (hoặc blob đang bị dọn): chờ tối đa bấy nhiêu giây, hỏi lại sau mỗi khoảng
+BLOB_WAIT_TIMEOUT = 600
+BLOB_POLL_INTERVAL = 1.0
+
+def _rpc_value(client: Client, name: str, params: Dict[str, Any]) -> Any:
+    """Kết quả của một RPC trả về một dòng hoặc một giá trị."""
+    data = client.rpc(name, params).execute().data
+    if isinstance(data, list):
+        return data[0] if data else None
+    return data
+
+def store_file_deduplicated(fileobj, user_id: str, content_type: str | None = None, on_progress=None) -> Dict[str, Any]:
+    """Lưu file theo mã băm nội dung: nếu đã có blob giống hệt thì không upload lại.
+
+    Mã băm do server tính trên chính các byte nó upload vào cas/ (bằng service role), blob chỉ được dùng chung
+    khi đã "ready", và `user_id` nhận một claim để gắn blob vào một dòng documents (trigger kiểm tra claim và tự
+    điền file_path). Thiếu SUPABASE_SERVICE_ROLE_KEY thì mỗi lần upload được lưu ở một đường dẫn riêng trong thư mục
+    của user (không khử trùng lặp, không ghi đè file của tài liệu khác).
+    Trả về {"file_path", "content_hash", "file_size", "uploaded"} để ghi vào bảng documents.
+    """
+    file_size = _file_size(fileobj)
+    sha256 = hash_file(fileobj)
+    service = get_service_client()
+    if service is None:
+        file_path = f"{user_id}/{int(time.time() * 1000)}_{uuid.uuid4().hex[:12]}"
+        upload_file_resumable(fileobj, file_path, content_type=content_type, on_progress=on_progress)
+        return {"file_path": file_path, "content_hash": None, "file_size": file_size, "uploaded": True}
+
+    uploaded = False
+    deadline = time.monotonic() + BLOB_WAIT_TIMEOUT
+    while True:
+        blob = _rpc_value(service, "reserve_blob", {
+            "p_sha256": sha256, "p_file_path": content_addressed_path(sha256), "p_file_size": file_size,
+        }) or {}
+        status = blob.get("status")
+        if blob.get("created"):
+            # Chỉ người tạo blob upload; các upload cùng nội dung chờ blob "ready"
+            try:
+                upload_file_resumable(fileobj, blob["file_path"], content_type=content_type, on_progress=on_progress, service=True)
+            except Exception:
+                service.rpc("abandon_blob", {"p_sha256": sha256}).execute()
+                raise
+            service.rpc("mark_blob_ready", {"p_sha256": sha256}).execute()
+            uploaded, status = True, "ready"
+        if status == "ready" and _rpc_value(service, "grant_blob_claim", {"p_user_id": user_id, "p_sha256": sha256}):
+            if on_progress and not uploaded:
+                on_progress(file_size, file_size)
+            return {"file_path": blob["file_path"], "content_hash": sha256, "file_size": file_size, "uploaded": uploaded}
+        if time.monotonic() > deadline:
+            raise RuntimeError("File cùng nội dung đang được upload hoặc dọn dẹp, vui lòng thử lại")
+        time.sleep(BLOB_POLL_INTERVAL)
+
+def purge_blob(sha256: str) -> bool:
+    """Xóa blob không còn tài liệu hay claim nào tham chiếu: object trên Storage trước, dòng storage_blobs sau."""
+    service = get_service_client()
+    if service is None:
+        return False
+    file_path = _rpc_value(service, "begin_blob_purge", {"p_sha256": sha256})
+    if not file_path:
+        return False
+    service.storage.from_("document_files").remove([file_path])
+    service.rpc("finish_blob_purge", {"p_sha256": sha256}).execute()
+    forget_signed_urls([file_path])
+    return True
+
+def discard_stored_file(stored: Dict[str, Any], user_id: str) -> None:
+    """Hoàn tác store_file_deduplicated khi không ghi được metadata tài liệu."""
+    if not stored.get("content_hash"):
+        remove_unreferenced_file(stored["file_path"])
+        return
+    service = get_service_client()
+    service.rpc("revoke_blob_claim", {"p_user_id": user_id, "p_sha256": stored["content_hash"]}).execute()
+    purge_blob(stored["content_hash"])
+
+# --- UPLOAD NHIỀU FILE SONG SONG ---
+
+# Số file được upload đồng thời
+UPLOAD_WORKERS = 4
+
+def store_files_concurrently(
+    files: List[Any],
+    user_id: str,
+    max_workers: int = UPLOAD_WORKERS,
+    on_tick: Optional[Callable[[Dict[int, tuple]], None]] = None,
+) -> List[Dict[str, Any] | Exception]:
+    """Lưu nhiều file lên Storage bằng một thread pool giới hạn.
+
+    Trả về kết quả của store_file_deduplicated (hoặc Exception) theo đúng thứ tự `files`.
+    on_tick({index: (sent, total)}) được gọi định kỳ trên thread gọi hàm (an toàn để cập nhật giao diện Streamlit).
+    """
+    progress: Dict[int, tuple] = {i: (0, getattr(f, "size", 0) or 0) for i, f in enumerate(files)}
+    lock = threading.Lock()
+    # Worker dùng lại context của session gọi hàm để get_client() trả về đúng client đã đăng nhập
+    ctx = get_script_run_ctx()
+
+    def work(index: int, fileobj) -> Dict[str, Any]:
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        def report(sent: int, total: int) -> None:
+            with lock:
+                progress[index] = (sent, total)
+        return store_file_deduplicated(fileobj, user_id, content_type=getattr(fileobj, "type", None), on_progress=report)
+
+    results: List[Dict[str, Any] | Exception] = [None] * len(files)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files) or 1))) as pool:
+        futures = {pool.submit(work, i, f): i for i, f in enumerate(files)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    results[index] = e
+            if on_tick:
+                with lock:
+                    snapshot = dict(progress)
+                on_tick(snapshot)
+    return results
+
+# --- SIGNED URL (LINK TẢI XUỐNG) ---
+
+# Thời hạn của signed URL và khoảng an toàn trước khi hết hạn thì ký lại
+SIGNED_URL_TTL = 3600
+SIGNED_URL_REFRESH_MARGIN = 300
+
+# file_path -> (signed_url, thời điểm hết hạn theo time.time())
+_signed_url_cache: Dict[str, tuple] = {}
+_signed_url_lock = threading.Lock()
+
+def get_signed_urls(file_paths: List[str], expires_in: int = SIGNED_URL_TTL) -> Dict[str, str]:
+    """Lấy signed URL cho nhiều file cùng lúc: dùng lại URL còn hạn, ký các file còn lại bằng một lần gọi create_signed_urls."""
+    now = time.time()
+    urls: Dict[str, str] = {}
+    missing: List[str] = []
+    with _signed_url_lock:
+        for path in dict.fromkeys(file_paths):
+            cached = _signed_url_cache.get(path)
+            if cached and cached[1] - SIGNED_URL_REFRESH_MARGIN > now:
+                urls[path] = cached[0]
+            else:
+                missing.append(path)
+    if missing:
+        signed = get_client().storage.from_("document_files").create_signed_urls(missing, expires_in)
+        expires_at = now + expires_in
+        with _signed_url_lock:
+            for item in signed or []:
+                url = item.get("signedURL") or item.get("signedUrl")
+                path = item.get("path")
+                if url and path and not item.get("error"):
+                    _signed_url_cache[path] = (url, expires_at)
+                    urls[path] = url
+    return urls
+
+def get_signed_url(file_path: str, expires_in: int = SIGNED_URL_TTL) -> str | None:
+    """Lấy signed URL cho một file (dùng chung cache với get_signed_urls)."""
+    return get_signed_urls([file_path], expires_in).get(file_path)
+
+def download_file(file_path: str) -> bytes:
+    """Tải nội dung file từ Storage."""
+    return get_client().storage.from_("document_files").download(file_path)
+
+def forget_signed_urls(file_paths: List[str]) -> None:
+    """Bỏ signed URL đã cache của các file (ví dụ khi file bị xóa)."""
+    with _signed_url_lock:
+        for path in file_paths:
+            _signed_url_cache.pop(path, None)
+
 # --- CÁC HÀM LIÊN QUAN ĐẾN MÔN HỌC (SUBJECTS) ---
 
 def get_user_subjects(user_id: str) -> List[Dict[str, Any]]:
     """Lấy tất cả môn học của một user."""
-    res = supabase.table("subjects").select("id, name").eq("user_id", user_id).order("name").execute()
+    res = get_client().table("subjects").select("id, name").eq("user_id", user_id).order("name").execute()
     return res.data
 
 def add_subject(user_id: str, name: str) -> None:
     """Thêm một môn học mới."""
-    supabase.table("subjects").insert({"name": name, "user_id": user_id}).execute()
+    get_client().table("subjects").insert({"name": name, "user_id": user_id}).execute()
+    _notify_change("subjects", user_id=user_id)
 
 def delete_subject(subject_id: int) -> None:
     """Xóa một môn học."""
-    supabase.table("subjects").delete().eq("id", subject_id).execute()
+    res = get_client().table("subjects").delete().eq("id", subject_id).execute()
+    _notify_change("subjects", res.data)
 
 def update_subject(subject_id: int, name: str) -> None:
     """Cập nhật tên môn học."""
-    supabase.table("subjects").update({"name": name}).eq("id", subject_id).execute()
+    res = get_client().table("subjects").update({"name": name}).eq("id", subject_id).execute()
+    _notify_change("subjects", res.data)
 
 def get_subject_by_id(subject_id: int) -> Dict[str, Any] | None:
     """Lấy thông tin môn học theo ID."""
-    res = supabase.table("subjects").select("id, name, user_id").eq("id", subject_id).single().execute()
+    res = get_client().table("subjects").select("id, name, user_id").eq("id", subject_id).single().execute()
     return res.data
\ No newline at end of file
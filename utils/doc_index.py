@@ -0,0 +1,158 @@
+# utils/doc_index.py
+import unicodedata
+import streamlit as st
+from typing import Any, Dict, Iterable, List, Optional
+
+# Độ dài n-gram lớn nhất được đánh chỉ mục cho chữ của tài liệu (tên file, tags, môn học)
+MAX_NGRAM = 3
+
+def normalize_name(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (kể cả đ) để so khớp tên file."""
+    text = (text or "").replace("đ", "d").replace("Đ", "D").lower()
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def _search_text(doc: Dict[str, Any]) -> str:
+    """Chữ được tìm theo từ khóa: tên file, các tag và tên môn học (như full-text search phía server)."""
+    subject = (doc.get("subjects") or {}).get("name") or ""
+    return normalize_name(" ".join([doc.get("file_name") or "", *(doc.get("tags") or []), subject]))
+
+def _ngrams(text: str, n: int) -> Iterable[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def _positions(bits: int) -> Iterable[int]:
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class DocumentIndex:
+    """Chỉ mục đảo ngược trong bộ nhớ cho các tài liệu đã tải của một session.
+
+    Mỗi tag và mỗi n-gram (1..MAX_NGRAM ký tự) của tên file + tags + tên môn học ánh xạ tới
+    một bitset (Python int) các vị trí tài liệu, nên lọc theo tag/từ khóa là phép AND giữa các
+    bitset thay vì duyệt toàn bộ danh sách. Cập nhật từng tài liệu khi thêm/sửa/xóa.
+    """
+    def __init__(self, documents: Iterable[Dict[str, Any]] = ()) -> None:
+        self._docs: List[Optional[Dict[str, Any]]] = []
+        self._positions: Dict[Any, int] = {}
+        self._tag_bits: Dict[str, int] = {}
+        self._ngram_bits: Dict[str, int] = {}
+        self._texts: List[str] = []
+        self._alive = 0
+        for doc in documents:
+            self.add(doc)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, doc_id: Any) -> bool:
+        return doc_id in self._positions
+
+    # -------- Cập nhật --------
+    def add(self, doc: Dict[str, Any]) -> None:
+        if doc["id"] in self._positions:
+            self.update(doc)
+            return
+        pos = len(self._docs)
+        self._docs.append(doc)
+        self._texts.append(_search_text(doc))
+        self._positions[doc["id"]] = pos
+        self._set_bits(pos, doc, self._texts[pos])
+        self._alive |= 1 << pos
+
+    def update(self, doc: Dict[str, Any]) -> None:
+        """Thay tài liệu đã có trong chỉ mục; tài liệu chưa có thì bỏ qua (chỉ mục chỉ gồm tài liệu đã tải của nó)."""
+        pos = self._positions.get(doc["id"])
+        if pos is None:
+            return
+        self._clear_bits(pos)
+        self._docs[pos] = doc
+        self._texts[pos] = _search_text(doc)
+        self._set_bits(pos, doc, self._texts[pos])
+
+    def remove(self, doc_id: Any) -> None:
+        pos = self._positions.pop(doc_id, None)
+        if pos is None:
+            return
+        self._clear_bits(pos)
+        self._docs[pos] = None
+        self._alive &= ~(1 << pos)
+
+    def sync(self, documents: Iterable[Dict[str, Any]]) -> None:
+        """Thêm các tài liệu chưa có trong chỉ mục (ví dụ sau khi "tải thêm")."""
+        for doc in documents:
+            if doc["id"] not in self._positions:
+                self.add(doc)
+
+    def _set_bits(self, pos: int, doc: Dict[str, Any], text: str) -> None:
+        bit = 1 << pos
+        for tag in doc.get("tags") or []:
+            self._tag_bits[tag] = self._tag_bits.get(tag, 0) | bit
+        for n in range(1, MAX_NGRAM + 1):
+            for gram in _ngrams(text, n):
+                self._ngram_bits[gram] = self._ngram_bits.get(gram, 0) | bit
+
+    def _clear_bits(self, pos: int) -> None:
+        mask = ~(1 << pos)
+        doc = self._docs[pos] or {}
+        for tag in doc.get("tags") or []:
+            bits = self._tag_bits.get(tag, 0) & mask
+            if bits:
+                self._tag_bits[tag] = bits
+            else:
+                self._tag_bits.pop(tag, None)
+        text = self._texts[pos]
+        for n in range(1, MAX_NGRAM + 1):
+            for gram in _ngrams(text, n):
+                bits = self._ngram_bits.get(gram, 0) & mask
+                if bits:
+                    self._ngram_bits[gram] = bits
+                else:
+                    self._ngram_bits.pop(gram, None)
+
+    # -------- Truy vấn --------
+    def all_tags(self) -> List[str]:
+        return sorted(self._tag_bits)
+
+    def filter(self, tags: Iterable[str] = (), query: str = "") -> List[Dict[str, Any]]:
+        """Tài liệu có đủ mọi tag trong `tags` và chứa mọi từ của `query` (trong tên, tags hoặc môn học), giữ nguyên thứ tự đã tải."""
+        bits = self._alive
+        for tag in tags:
+            bits &= self._tag_bits.get(tag, 0)
+            if not bits:
+                return []
+        terms = normalize_name(query).split()
+        for term in terms:
+            n = min(len(term), MAX_NGRAM)
+            for gram in _ngrams(term, n):
+                bits &= self._ngram_bits.get(gram, 0)
+                if not bits:
+                    return []
+        long_terms = [t for t in terms if len(t) > MAX_NGRAM]
+        if long_terms:
+            # Các n-gram khớp chưa chắc nằm liền nhau: kiểm tra lại trên tập ứng viên nhỏ
+            return [self._docs[p] for p in _positions(bits) if all(t in self._texts[p] for t in long_terms)]
+        return [self._docs[p] for p in _positions(bits)]
+
+def get_document_index(key: str, documents: List[Dict[str, Any]], scope: Any = None) -> DocumentIndex:
+    """Chỉ mục của session cho danh sách tài liệu; xây một lần rồi chỉ thêm các tài liệu mới."""
+    state = st.session_state.get(key)
+    if state is None or state["scope"] != scope:
+        state = {"scope": scope, "index": DocumentIndex(documents)}
+        st.session_state[key] = state
+    else:
+        state["index"].sync(documents)
+    return state["index"]
+
+def update_indexed_document(key: str, doc: Dict[str, Any]) -> None:
+    """Cập nhật một tài liệu trong chỉ mục của session (nếu đã có chỉ mục)."""
+    state = st.session_state.get(key)
+    if state is not None:
+        state["index"].update(doc)
+
+def remove_indexed_document(key: str, doc_id: Any) -> None:
+    """Xóa một tài liệu khỏi chỉ mục của session (nếu đã có chỉ mục)."""
+    state = st.session_state.get(key)
+    if state is not None:
+        state["index"].remove(doc_id)
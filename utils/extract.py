@@ -0,0 +1,177 @@
+# utils/extract.py
+import io
+import logging
+import threading
+import time
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from . import semantic
+from .db import get_service_client
+
+logger = logging.getLogger(__name__)
+
+# Số file được trích xuất đồng thời trong nền
+EXTRACTION_WORKERS = 2
+# Giới hạn số ký tự nội dung lưu cho mỗi file
+MAX_CONTENT_CHARS = 1_000_000
+# Blob đã trích xuất nhưng chưa embed xong (theo model hiện tại) được thử lại định kỳ, mỗi lần một lô
+EMBEDDING_RETRY_INTERVAL = 600
+EMBEDDING_RETRY_BATCH = 20
+
+# --- TRÍCH XUẤT VĂN BẢN THEO ĐỊNH DẠNG ---
+# Các thư viện đọc file là tùy chọn; thiếu thư viện nào thì định dạng đó được bỏ qua.
+
+def _extract_pdf(data: bytes) -> str:
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(data))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+def _extract_docx(data: bytes) -> str:
+    import docx
+    document = docx.Document(io.BytesIO(data))
+    parts = [p.text for p in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append(" ".join(cell.text for cell in row.cells))
+    return "\n".join(parts)
+
+def _extract_pptx(data: bytes) -> str:
+    from pptx import Presentation
+    presentation = Presentation(io.BytesIO(data))
+    parts = []
+    for slide in presentation.slides:
+        for shape in slide.shapes:
+            if getattr(shape, "has_text_frame", False):
+                parts.append(shape.text_frame.text)
+    return "\n".join(parts)
+
+def _extract_xlsx(data: bytes) -> str:
+    from openpyxl import load_workbook
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    parts = []
+    for sheet in workbook.worksheets:
+        for row in sheet.iter_rows(values_only=True):
+            cells = [str(v) for v in row if v is not None]
+            if cells:
+                parts.append(" ".join(cells))
+    return "\n".join(parts)
+
+def _extract_txt(data: bytes) -> str:
+    return data.decode("utf-8", errors="ignore")
+
+EXTRACTORS: Dict[str, Callable[[bytes], str]] = {
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "pptx": _extract_pptx,
+    "xlsx": _extract_xlsx,
+    "txt": _extract_txt,
+}
+
+def extract_text(data: bytes, file_name: str) -> str | None:
+    """Trích xuất văn bản từ nội dung file; None nếu định dạng không hỗ trợ hoặc thiếu thư viện."""
+    ext = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+    extractor = EXTRACTORS.get(ext)
+    if extractor is None:
+        return None
+    try:
+        text = extractor(data)
+    except ImportError:
+        logger.warning("Thiếu thư viện để đọc file .%s, bỏ qua trích xuất", ext)
+        return None
+    # Postgres text không chứa được ký tự NUL
+    return text.replace("\x00", " ")[:MAX_CONTENT_CHARS]
+
+# --- WORKER CHẠY NỀN ---
+
+@st.cache_resource
+def get_extraction_pool() -> ThreadPoolExecutor:
+    """Thread pool dùng chung cho việc trích xuất, tách khỏi thread xử lý request."""
+    return ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extract")
+
+def _embed_content(client, content_hash: str, text: str, provider, label: str) -> None:
+    """Chia đoạn + embed cho tìm kiếm ngữ nghĩa, rồi ghi trạng thái embedding vào blob_contents."""
+    try:
+        # Đoạn đã có embedding thì không gọi API lại
+        semantic.index_content(client, content_hash, text, provider)
+    except Exception as e:
+        logger.exception("Tạo embedding thất bại: %s", label)
+        try:
+            client.table("blob_contents").update({"embedding_error": str(e)[:500]}).eq("content_hash", content_hash).execute()
+        except Exception:
+            logger.exception("Không ghi được trạng thái embedding: %s", label)
+        return
+    client.table("blob_contents").update({
+        "embedding_model": provider.name,
+        "embedded_at": datetime.now(timezone.utc).isoformat(),
+        "embedding_error": None,
+    }).eq("content_hash", content_hash).execute()
+
+def _extract_and_store(client, content_hash: str, file_path: str, file_name: str) -> None:
+    provider = semantic.get_embedding_provider()
+    try:
+        existing = client.table("blob_contents").select("content, embedding_model").eq("content_hash", content_hash).execute()
+        if existing.data:
+            # Cùng nội dung đã được trích xuất (file upload trùng): chỉ embed lại nếu lần trước chưa xong
+            if existing.data[0].get("embedding_model") == provider.name:
+                return
+            text = existing.data[0]["content"]
+        else:
+            data = client.storage.from_("document_files").download(file_path)
+            text = extract_text(data, file_name)
+            if text is None:
+                return
+            client.table("blob_contents").upsert({"content_hash": content_hash, "content": text}).execute()
+    except Exception:
+        logger.exception("Trích xuất nội dung thất bại: %s", file_path)
+        return
+    _embed_content(client, content_hash, text, provider, file_path)
+
+_last_embedding_retry = 0.0
+_embedding_retry_lock = threading.Lock()
+
+def _retry_pending_embeddings(client) -> None:
+    """Embed lại một lô blob có nội dung nhưng chưa có embedding của model hiện tại (lần trước lỗi hoặc đổi model)."""
+    provider = semantic.get_embedding_provider()
+    try:
+        res = (
+            client.table("blob_contents")
+            .select("content_hash, content")
+            .or_(f'embedding_model.is.null,embedding_model.neq."{provider.name}"')
+            .order("extracted_at")
+            .limit(EMBEDDING_RETRY_BATCH)
+            .execute()
+        )
+    except Exception:
+        logger.exception("Không lấy được danh sách blob cần embed lại")
+        return
+    for row in res.data or []:
+        _embed_content(client, row["content_hash"], row["content"], provider, row["content_hash"])
+
+def extraction_enabled() -> bool:
+    """Nội dung file chỉ được trích xuất (và tìm được) khi server có service role key."""
+    return get_service_client() is not None
+
+def schedule_extraction(documents: List[Dict[str, Any]]) -> None:
+    """Đưa các tài liệu vừa upload vào hàng đợi trích xuất nội dung (không chặn request).
+
+    Worker ghi nội dung bằng service role: blob_contents dùng chung giữa các user nên người dùng không được ghi trực tiếp.
+    Thiếu SUPABASE_SERVICE_ROLE_KEY thì không trích xuất (tài liệu cũng không có content_hash).
+    Tối đa mỗi EMBEDDING_RETRY_INTERVAL giây, một lô blob embed lỗi lần trước cũng được đưa vào hàng đợi.
+    """
+    global _last_embedding_retry
+    client = get_service_client()
+    if client is None:
+        return
+    pool = get_extraction_pool()
+    for doc in documents:
+        if doc.get("content_hash") and doc.get("file_path"):
+            pool.submit(_extract_and_store, client, doc["content_hash"], doc["file_path"], doc.get("file_name", ""))
+
+    with _embedding_retry_lock:
+        if time.time() - _last_embedding_retry < EMBEDDING_RETRY_INTERVAL:
+            return
+        _last_embedding_retry = time.time()
+    pool.submit(_retry_pending_embeddings, client)
@@ -0,0 +1,80 @@
+# utils/grid.py
+import streamlit as st
+from typing import Any, Callable, Dict, List, Optional
+
+# Số hàng thẻ hiển thị thêm mỗi lần mở rộng cửa sổ
+GRID_WINDOW_ROWS = 5
+
+Item = Dict[str, Any]
+
+def _window_state(key: str, scope: Any, step: int) -> Dict[str, Any]:
+    """Số thẻ đang hiển thị của lưới; về lại cửa sổ đầu tiên khi scope (bộ lọc, user...) thay đổi."""
+    state_key = f"{key}_window"
+    state = st.session_state.get(state_key)
+    if state is None or state["scope"] != scope:
+        state = {"scope": scope, "visible": step}
+        st.session_state[state_key] = state
+    return state
+
+@st.fragment
+def _render_window(
+    key: str,
+    items: List[Item],
+    render_card: Optional[Callable[[Item], None]],
+    render_items: Optional[Callable[[List[Item]], None]],
+    columns: int,
+    step: int,
+    scope: Any,
+    has_more: Callable[[], bool],
+    load_more: Optional[Callable[[], None]],
+    prepare: Optional[Callable[[List[Item]], None]],
+) -> None:
+    state = _window_state(key, scope, step)
+    visible = items[:state["visible"]]
+    if prepare is not None:
+        prepare(visible)
+
+    if render_items is not None:
+        render_items(visible)
+    else:
+        for i in range(0, len(visible), columns):
+            cols = st.columns(columns)
+            for col, item in zip(cols, visible[i:i + columns]):
+                with col:
+                    render_card(item)
+
+    more_loaded = len(items) > len(visible)
+    if not more_loaded and not has_more():
+        return
+    col1, col2, col3 = st.columns([1, 1, 1])
+    with col2:
+        if st.button("⬇️ Hiển thị thêm", key=f"{key}_more", use_container_width=True):
+            state["visible"] += step
+            if more_loaded:
+                # Thẻ đã có sẵn trong bộ nhớ: chỉ chạy lại lưới
+                st.rerun(scope="fragment")
+            # Hết dữ liệu đã tải: lấy trang kế tiếp rồi chạy lại cả trang để bộ lọc/đếm cập nhật
+            load_more()
+            st.rerun()
+
+def render_windowed_grid(
+    key: str,
+    items: List[Item],
+    render_card: Optional[Callable[[Item], None]] = None,
+    columns: int = 2,
+    rows_per_window: int = GRID_WINDOW_ROWS,
+    scope: Any = None,
+    has_more: Callable[[], bool] = lambda: False,
+    load_more: Optional[Callable[[], None]] = None,
+    prepare: Optional[Callable[[List[Item]], None]] = None,
+    render_items: Optional[Callable[[List[Item]], None]] = None,
+) -> None:
+    """Lưới thẻ chỉ render một cửa sổ các hàng đầu tiên thay vì toàn bộ danh sách.
+
+    "Hiển thị thêm" mở rộng cửa sổ trong một fragment (không chạy lại cả trang); khi đã hiển thị
+    hết các tài liệu đã tải, `load_more` lấy trang kế tiếp từ nguồn phân trang.
+    `prepare(visible)` chạy trước khi render cửa sổ, ví dụ để ký link tải xuống cho đúng các thẻ đang hiện.
+    Thẻ không có nút có thể render cả cửa sổ một lần qua `render_items(visible)` thay cho `render_card`.
+    """
+    _render_window(key, items, render_card, render_items, columns, columns * rows_per_window, scope,
+                   has_more, load_more, prepare)
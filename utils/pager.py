@@ -0,0 +1,46 @@
+# utils/pager.py
+import streamlit as st
+from typing import Any, Callable, Dict, Optional
+
+# fetch_page(cursor) -> {"data": [...], "next_cursor": {...} | None}
+FetchPage = Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]
+
+def get_pager(key: str, scope: Any) -> Dict[str, Any]:
+    """Lấy trạng thái phân trang trong session_state; khởi tạo lại nếu scope (user, bộ lọc...) thay đổi."""
+    pager = st.session_state.get(key)
+    if pager is None or pager.get("scope") != scope:
+        pager = {"scope": scope, "items": [], "cursor": None, "has_more": True}
+        st.session_state[key] = pager
+    return pager
+
+def load_next_page(pager: Dict[str, Any], fetch_page: FetchPage) -> None:
+    """Tải thêm một trang và nối vào danh sách đã tải."""
+    if not pager["has_more"]:
+        return
+    page = fetch_page(pager["cursor"])
+    pager["items"].extend(page["data"])
+    pager["cursor"] = page["next_cursor"]
+    pager["has_more"] = page["next_cursor"] is not None
+
+def ensure_first_page(pager: Dict[str, Any], fetch_page: FetchPage) -> None:
+    """Tải trang đầu tiên nếu chưa có dữ liệu."""
+    if not pager["items"] and pager["has_more"]:
+        load_next_page(pager, fetch_page)
+
+def reset_pager(key: str) -> None:
+    """Xóa trạng thái phân trang để lần render sau tải lại từ đầu."""
+    st.session_state.pop(key, None)
+
+def update_pager_item(key: str, item: Dict[str, Any]) -> None:
+    """Thay một phần tử (theo id) trong danh sách đã tải, nếu có."""
+    pager = st.session_state.get(key)
+    if pager is None:
+        return
+    pager["items"] = [item if d.get("id") == item.get("id") else d for d in pager["items"]]
+
+def remove_pager_item(key: str, item_id: Any) -> None:
+    """Bỏ một phần tử (theo id) khỏi danh sách đã tải, nếu có."""
+    pager = st.session_state.get(key)
+    if pager is None:
+        return
+    pager["items"] = [d for d in pager["items"] if d.get("id") != item_id]
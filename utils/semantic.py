@@ -0,0 +1,207 @@
+# utils/semantic.py
+import hashlib
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+from .db import get_client, get_http_pool, get_service_client
+
+logger = logging.getLogger(__name__)
+
+# Số chiều vector lưu trong cột pgvector; mọi provider đều trả về đúng số chiều này
+EMBEDDING_DIM = 1024
+# Cắt văn bản thành các đoạn ~CHUNK_CHARS ký tự, chồng lấn CHUNK_OVERLAP ký tự
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+# Số đoạn gửi trong một lần gọi API embedding
+EMBED_BATCH_SIZE = 96
+# Số embedding của câu truy vấn được giữ trong bộ nhớ
+QUERY_CACHE_SIZE = 256
+
+# --- CHIA ĐOẠN ---
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Chia văn bản thành các đoạn chồng lấn, ưu tiên cắt ở ranh giới đoạn/câu/từ."""
+    text = re.sub(r"[ \t]+", " ", text or "").strip()
+    chunks: List[str] = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            window = text[start:end]
+            cut = max(window.rfind("\n"), window.rfind(". "), window.rfind(" "))
+            if cut > chunk_chars // 2:
+                end = start + cut + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+# --- PROVIDER EMBEDDING ---
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class LocalHashingEmbeddings:
+    """Mô hình thay thế chạy cục bộ (feature hashing từ + trigram ký tự) để thử nghiệm offline, không cần API key."""
+    name = "local-hashing-v1"
+
+    def embed(self, texts: List[str], task: str = "document") -> List[List[float]]:
+        return [self._embed_one(t) for t in texts]
+
+    def _embed_one(self, text: str) -> List[float]:
+        folded = unicodedata.normalize("NFKD", text.replace("đ", "d").replace("Đ", "D").lower())
+        folded = "".join(c for c in folded if not unicodedata.combining(c))
+        vector = [0.0] * EMBEDDING_DIM
+        for word in re.findall(r"\w+", folded):
+            features = [word] + [word[i:i + 3] for i in range(max(len(word) - 2, 1))]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                index = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+                vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return _normalize(vector)
+
+class GoogleEmbeddings:
+    """Gemini embedding API (GOOGLE_API_KEY), rút gọn về EMBEDDING_DIM chiều."""
+    name = "gemini-embedding-001"
+    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-embedding-001:batchEmbedContents"
+
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+
+    def embed(self, texts: List[str], task: str = "document") -> List[List[float]]:
+        task_type = "RETRIEVAL_QUERY" if task == "query" else "RETRIEVAL_DOCUMENT"
+        body = {"requests": [{
+            "model": "models/gemini-embedding-001",
+            "content": {"parts": [{"text": t}]},
+            "taskType": task_type,
+            "outputDimensionality": EMBEDDING_DIM,
+        } for t in texts]}
+        res = get_http_pool().post(self.url, params={"key": self.api_key}, json=body)
+        res.raise_for_status()
+        # Vector rút gọn chiều không còn chuẩn hóa sẵn
+        return [_normalize(e["values"]) for e in res.json()["embeddings"]]
+
+class CohereEmbeddings:
+    """Cohere embed-multilingual-v3.0 (COHERE_API_KEY), 1024 chiều."""
+    name = "embed-multilingual-v3.0"
+    url = "https://api.cohere.com/v2/embed"
+
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+
+    def embed(self, texts: List[str], task: str = "document") -> List[List[float]]:
+        res = get_http_pool().post(self.url, headers={"authorization": f"Bearer {self.api_key}"}, json={
+            "model": self.name,
+            "texts": texts,
+            "input_type": "search_query" if task == "query" else "search_document",
+            "embedding_types": ["float"],
+        })
+        res.raise_for_status()
+        return res.json()["embeddings"]["float"]
+
+@st.cache_resource
+def get_embedding_provider(name: Optional[str] = None):
+    """Chọn provider theo EMBEDDING_PROVIDER (google | cohere | local); mặc định dùng API key nào có sẵn."""
+    name = (name or st.secrets.get("EMBEDDING_PROVIDER", "")).lower()
+    google_key = st.secrets.get("GOOGLE_API_KEY", "")
+    cohere_key = st.secrets.get("COHERE_API_KEY", "")
+    if name == "local":
+        return LocalHashingEmbeddings()
+    if name == "cohere" or (not name and not google_key and cohere_key):
+        return CohereEmbeddings(cohere_key)
+    if google_key:
+        return GoogleEmbeddings(google_key)
+    return LocalHashingEmbeddings()
+
+def _to_pgvector(vector: List[float]) -> str:
+    return "[" + ",".join(f"{v:.6f}" for v in vector) + "]"
+
+# --- ĐÁNH CHỈ MỤC ---
+
+def index_content(client, content_hash: str, text: str, provider=None) -> int:
+    """Chia đoạn và embed nội dung của một blob; đoạn nào đã có embedding (theo hash) thì dùng lại.
+
+    Trả về số đoạn phải gọi API embedding.
+    """
+    provider = provider or get_embedding_provider()
+    chunks = chunk_text(text)
+    if not chunks:
+        return 0
+    hashes = [chunk_hash(c) for c in chunks]
+    client.table("blob_chunks").upsert([
+        {"content_hash": content_hash, "chunk_index": i, "chunk_hash": h, "content": c}
+        for i, (h, c) in enumerate(zip(hashes, chunks))
+    ]).execute()
+
+    unique = dict(zip(hashes, chunks))
+    cached = set()
+    hash_list = list(unique)
+    for i in range(0, len(hash_list), 200):
+        res = (
+            client.table("chunk_embeddings")
+            .select("chunk_hash")
+            .eq("model", provider.name)
+            .in_("chunk_hash", hash_list[i:i + 200])
+            .execute()
+        )
+        cached.update(r["chunk_hash"] for r in res.data or [])
+    missing = [h for h in hash_list if h not in cached]
+    for i in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[i:i + EMBED_BATCH_SIZE]
+        vectors = provider.embed([unique[h] for h in batch], task="document")
+        # Embedding dùng chung giữa các user: chỉ ghi qua RPC (kiểm tra quyền trên blob), không ghi thẳng vào bảng
+        client.rpc("upsert_chunk_embeddings", {
+            "p_content_hash": content_hash,
+            "p_model": provider.name,
+            "p_rows": [{"chunk_hash": h, "embedding": _to_pgvector(v)} for h, v in zip(batch, vectors)],
+        }).execute()
+    return len(missing)
+
+# --- TÌM KIẾM ---
+
+def semantic_search_enabled() -> bool:
+    """Nội dung chỉ được embed khi server có service role key (worker trích xuất); thiếu thì không có gì để tìm."""
+    return get_service_client() is not None
+
+_query_cache: "OrderedDict[tuple, List[float]]" = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+def embed_query(query: str, provider=None) -> List[float]:
+    """Embedding của câu truy vấn, có cache LRU trong bộ nhớ để truy vấn lặp lại không gọi API."""
+    provider = provider or get_embedding_provider()
+    key = (provider.name, query.strip().lower())
+    with _query_cache_lock:
+        if key in _query_cache:
+            _query_cache.move_to_end(key)
+            return _query_cache[key]
+    vector = provider.embed([query], task="query")[0]
+    with _query_cache_lock:
+        _query_cache[key] = vector
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return vector
+
+def semantic_search(user_id: str, query: str, limit: int = 20, provider=None) -> Dict[str, Any]:
+    """Tìm tài liệu theo ngữ nghĩa qua chỉ mục HNSW; trả về một trang (không có trang sau) như search_documents."""
+    provider = provider or get_embedding_provider()
+    res = get_client().rpc("match_document_chunks", {
+        "p_user_id": user_id,
+        "p_query_embedding": _to_pgvector(embed_query(query, provider)),
+        "p_model": provider.name,
+        "p_limit": limit,
+    }).execute()
+    return {"data": res.data or [], "next_cursor": None}
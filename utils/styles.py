@@ -0,0 +1,149 @@
+# utils/styles.py
+import hashlib
+import json
+import os
+import re
+from string import Template
+from typing import Tuple
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+STYLESHEET_PATH = "styles/custom.css"
+# session_state: phiên bản stylesheet / theme đã gắn vào trang của session này
+STYLESHEET_STATE_KEY = "injected_stylesheets"
+THEME_STATE_KEY = "applied_theme"
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+
+# Script chạy trong iframe của components.html, gắn <style> vào <head> của trang cha.
+# Thẻ <style> nằm ngoài cây React nên không bị xóa khi script Streamlit chạy lại.
+_INJECT_STYLESHEET = Template("""<script>
+(function() {
+    const doc = window.parent.document;
+    let el = doc.getElementById("$element_id");
+    if (!el) {
+        el = doc.createElement("style");
+        el.id = "$element_id";
+        doc.head.appendChild(el);
+    }
+    if (el.dataset.version !== "$version") {
+        el.textContent = $css;
+        el.dataset.version = "$version";
+    }
+})();
+</script>""")
+
+# localStorage key giữ theme người dùng chọn (trình duyệt là nơi quyết định theme)
+THEME_STORAGE_KEY = "app-theme"
+
+# Áp theme lên trang cha; theme đã lưu trong trình duyệt được ưu tiên hơn giá trị từ server
+_APPLY_THEME = Template("""<script>
+(function() {
+    const parent = window.parent;
+    const theme = parent.localStorage.getItem("$storage_key") || "$theme";
+    parent.document.documentElement.setAttribute("data-theme", theme);
+    const app = parent.document.querySelector(".stApp");
+    if (app) {
+        app.setAttribute("data-theme", theme);
+    }
+})();
+</script>""")
+
+# Nút đổi theme chạy hoàn toàn phía trình duyệt: không gửi gì về server, không rerun.
+# Lựa chọn được lưu trong localStorage và ghi vào ?theme= trên URL (history.replaceState),
+# server chỉ đọc được giá trị này ở lần rerun tự nhiên kế tiếp.
+_THEME_SWITCH = Template("""<style>
+body { margin: 0; font-family: "Inter", sans-serif; }
+button {
+    width: 100%; height: 38px; border-radius: 10px; cursor: pointer; font-size: 0.95rem;
+    border: 1px solid rgba(148, 163, 184, 0.4); background: transparent; color: #667eea;
+}
+</style>
+<button id="theme-switch" type="button"></button>
+<script>
+(function() {
+    const parent = window.parent;
+    const button = document.getElementById("theme-switch");
+    function apply(theme) {
+        parent.document.documentElement.setAttribute("data-theme", theme);
+        const app = parent.document.querySelector(".stApp");
+        if (app) {
+            app.setAttribute("data-theme", theme);
+        }
+        parent.localStorage.setItem("$storage_key", theme);
+        const url = new URL(parent.location.href);
+        url.searchParams.set("theme", theme);
+        parent.history.replaceState(parent.history.state, "", url);
+        button.dataset.theme = theme;
+        button.textContent = theme === "dark" ? "🌙 Tối" : "🌞 Sáng";
+        button.title = "Chuyển chế độ sáng/tối";
+    }
+    apply(parent.localStorage.getItem("$storage_key") || "$theme");
+    button.addEventListener("click", function() {
+        apply(button.dataset.theme === "dark" ? "light" : "dark");
+    });
+})();
+</script>""")
+
+def minify_css(css: str) -> str:
+    """Bỏ comment và khoảng trắng thừa (không đổi ngữ nghĩa selector / giá trị)."""
+    css = _COMMENT.sub("", css)
+    css = _WHITESPACE.sub(" ", css)
+    css = _PUNCTUATION.sub(r"\1", css)
+    return css.replace(";}", "}").strip()
+
+@st.cache_resource
+def _read_stylesheet(path: str, mtime: float) -> Tuple[str, str]:
+    """Đọc + minify stylesheet; cache theo (path, mtime) nên chỉ đọc lại khi file được sửa."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            css = minify_css(f.read())
+    except OSError:
+        return "", ""
+    return css, hashlib.sha1(css.encode("utf-8")).hexdigest()[:12]
+
+def load_stylesheet(path: str = STYLESHEET_PATH) -> Tuple[str, str]:
+    """Stylesheet đã minify, dùng chung cho cả process; trả về (css, version)."""
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return "", ""
+    return _read_stylesheet(path, mtime)
+
+def inject_stylesheet(path: str = STYLESHEET_PATH) -> None:
+    """Gắn stylesheet vào trang một lần cho mỗi session (và khi nội dung file đổi), không gửi lại mỗi lần rerun.
+
+    Đổi theme không cần gửi lại CSS: màu sắc là các biến CSS theo thuộc tính data-theme.
+    """
+    css, version = load_stylesheet(path)
+    if not css:
+        return
+    injected = st.session_state.setdefault(STYLESHEET_STATE_KEY, {})
+    if injected.get(path) == version:
+        return
+    element_id = "app-css-" + hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+    # "</" không được xuất hiện trong nội dung <script>
+    payload = json.dumps(css).replace("</", "<\\/")
+    components.html(_INJECT_STYLESHEET.substitute(element_id=element_id, version=version, css=payload), height=0)
+    injected[path] = version
+
+def apply_document_theme(theme: str) -> None:
+    """Đặt data-theme trên trang cha; chỉ gửi khi theme của session thay đổi."""
+    safe_theme = "dark" if theme == "dark" else "light"
+    if st.session_state.get(THEME_STATE_KEY) == safe_theme:
+        return
+    components.html(_APPLY_THEME.substitute(theme=safe_theme, storage_key=THEME_STORAGE_KEY), height=0)
+    st.session_state[THEME_STATE_KEY] = safe_theme
+
+def render_theme_switch(theme: str) -> None:
+    """Nút sáng/tối chạy phía trình duyệt; `theme` chỉ là giá trị mặc định khi trình duyệt chưa lưu lựa chọn."""
+    safe_theme = "dark" if theme == "dark" else "light"
+    components.html(_THEME_SWITCH.substitute(theme=safe_theme, storage_key=THEME_STORAGE_KEY), height=42)
+
+def reflected_theme(default: str = "light") -> str:
+    """Theme trình duyệt đã ghi vào ?theme= (đến server cùng lần rerun kế tiếp), hoặc `default`."""
+    theme = st.query_params.get("theme")
+    return theme if theme in ("light", "dark") else default